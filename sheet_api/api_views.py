@@ -1,12 +1,38 @@
+import json
+
 from django.contrib.auth.models import User, Group
-from rest_framework import viewsets, generics, status
+from rest_framework import viewsets, generics, serializers, status
 from rest_framework import permissions
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.db.models import Max, Min
+from django.db.models import Count, Max
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from silk.profiling.profiler import silk_profile
 
-from sheet_api.models import Puzzle, Work, Composer, UsageEvent
+from sheet_api.catalog import get_catalog
+from sheet_api.frontier import get_latest_visible_date
+from sheet_api.guesses import get_guessable_work, score_guess
+from sheet_api.http_caching import (
+    CacheUntilRolloverMixin,
+    ConditionalGetMixin,
+    cache_forever,
+    is_not_modified,
+    latest_of,
+    make_etag,
+    not_modified_response,
+    puzzle_version,
+    set_validators,
+)
+from sheet_api.metrics import collect_metrics
+from sheet_api.models import Puzzle, PuzzleStats, Work, Composer, UsageEvent
+from sheet_api.puzzle_index import (
+    existing_puzzle_ids,
+    get_puzzle_answer,
+    puzzle_exists,
+)
+from sheet_api.response_cache import composer_works_cache, latest_puzzle_cache
 from sheet_api.serializers import (
     UserSerializer,
     GroupSerializer,
@@ -15,9 +41,24 @@ from sheet_api.serializers import (
     ComposerSerializer,
     WorkWithoutComposerSerializer,
     UsageEventSerializer,
+    GuessSerializer,
+    PuzzleStatsSerializer,
+)
+from sheet_api.time_helpers import get_request_date
+from sheet_api.usage_events import (
+    make_usage_event,
+    record_usage_event,
+    record_usage_events,
 )
-from sheet_api.time_helpers import get_timezone_aware_date
-from sheet_musicle_server.settings import HIDE_NEW_PUZZLES, SKIP_USAGE_EVENT_WRITE
+from sheet_api.work_index import DEFAULT_SEARCH_LIMIT, get_work_index
+from sheet_musicle_server.settings import HIDE_NEW_PUZZLES
+
+# rows fetched per round trip when streaming a works list
+WORKS_STREAM_CHUNK_SIZE = 500
+MAX_SEARCH_LIMIT = 50
+MAX_USAGE_EVENT_BATCH = 100
+# stats only change when the rollup runs, so clients and CDNs can reuse them briefly
+STATS_MAX_AGE_SECONDS = 60
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -40,28 +81,87 @@ class GroupViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
 
-class PuzzleViewSet(viewsets.ReadOnlyModelViewSet):
+class PuzzlePagination(PageNumberPagination):
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 500
+
+
+class PuzzleViewSet(
+    CacheUntilRolloverMixin, ConditionalGetMixin, viewsets.ReadOnlyModelViewSet
+):
     """ """
 
-    queryset = Puzzle.objects.all()
+    # sequence numbers are stored and is_latest reads the cached frontier, so with the
+    # answer and composer joined in, a page costs the same few queries at any size
+    queryset = Puzzle.objects.select_related("answer__composer").order_by(
+        "type", "date"
+    )
     serializer_class = PuzzleSerializer
     permission_classes = []
+    pagination_class = PuzzlePagination
+    etag_version_field = "updated_at"
+
+    def get_etag_extra(self, request):
+        # is_latest depends on the user's local date
+        return (get_request_date(request),)
+
+    def get_instance_version(self, request, instance):
+        return puzzle_version(instance, *self.get_etag_extra(request))
+
+    def get_list_version(self, queryset) -> dict:
+        # the nested answer and its composer are part of every puzzle
+        version = queryset.aggregate(
+            count=Count("pk"),
+            puzzle=Max("updated_at"),
+            work_scanned=Max("answer__last_scanned"),
+            work_edited=Max("answer__updated_at"),
+            composer_scanned=Max("answer__composer__last_scanned"),
+            composer_edited=Max("answer__composer__updated_at"),
+        )
+        version["last_modified"] = latest_of(
+            version["puzzle"],
+            version["work_scanned"],
+            version["work_edited"],
+            version["composer_scanned"],
+            version["composer_edited"],
+        )
+        return version
 
 
-class ComposerViewSet(viewsets.ReadOnlyModelViewSet):
+class ComposerViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """ """
 
     queryset = Composer.objects.all()
     serializer_class = ComposerSerializer
     permission_classes = []
+    # moves on admin edits and whenever the stored work stats are refreshed
+    etag_version_field = "updated_at"
 
 
-class WorkViewSet(viewsets.ReadOnlyModelViewSet):
+class WorkViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """ """
 
     queryset = Work.objects.all()
     serializer_class = WorkSerializer
     permission_classes = []
+    # admin edits only move updated_at, rescans only last_scanned
+    etag_version_field = "updated_at"
+
+    def get_list_version(self, queryset) -> dict:
+        version = queryset.aggregate(
+            count=Count("pk"), edited=Max("updated_at"), scanned=Max("last_scanned")
+        )
+        version["last_modified"] = latest_of(version["edited"], version["scanned"])
+        return version
+
+    def get_instance_version(self, request, instance):
+        etag = make_etag(
+            instance.pk,
+            instance.updated_at.isoformat(),
+            instance.last_scanned.isoformat(),
+        )
+        return etag, latest_of(instance.updated_at, instance.last_scanned)
 
 
 class WorkFilterView(generics.ListAPIView):
@@ -78,6 +178,90 @@ class WorkFilterView(generics.ListAPIView):
 
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        composer_id = self.kwargs.get("composer_id", None) or None
+        # checked on every request, since the scraper and admin edits on other
+        # workers change works without reaching this worker's signal handlers
+        version = self.get_queryset().aggregate(
+            count=Count("id"),
+            last_scanned=Max("last_scanned"),
+            updated_at=Max("updated_at"),
+        )
+        last_modified = max(
+            filter(None, (version["last_scanned"], version["updated_at"])),
+            default=None,
+        )
+        etag = make_etag(
+            composer_id,
+            version["count"],
+            version["last_scanned"].isoformat() if version["last_scanned"] else None,
+            version["updated_at"].isoformat() if version["updated_at"] else None,
+        )
+        if is_not_modified(request, etag, last_modified):
+            return not_modified_response(etag, last_modified)
+
+        cached = composer_works_cache.get(composer_id)
+        if cached is not None:
+            body, cached_etag = cached
+            if cached_etag == etag:
+                response = HttpResponse(body, content_type="application/json")
+                return set_validators(response, etag, last_modified)
+
+        def render_and_cache():
+            chunks = []
+            for chunk in self._render_works():
+                chunks.append(chunk)
+                yield chunk
+            body = b"".join(chunks)
+            composer_works_cache.set(composer_id, (body, etag))
+
+        response = StreamingHttpResponse(
+            render_and_cache(), content_type="application/json"
+        )
+        return set_validators(response, etag, last_modified)
+
+    def _render_works(self):
+        """
+        Same JSON as WorkWithoutComposerSerializer(many=True), rendered straight from
+        .values() rows in chunks instead of through model instances.
+        """
+        fields = WorkWithoutComposerSerializer.Meta.fields
+        last_scanned_field = serializers.DateTimeField()
+        rows = self.get_queryset().order_by("id").values(*fields)
+
+        yield b"["
+        separator = b""
+        for row in rows.iterator(chunk_size=WORKS_STREAM_CHUNK_SIZE):
+            row["last_scanned"] = last_scanned_field.to_representation(
+                row["last_scanned"]
+            )
+            yield separator + json.dumps(
+                row, ensure_ascii=False, separators=(",", ":")
+            ).encode()
+            separator = b","
+        yield b"]"
+
+
+class WorkSearchView(APIView):
+    permission_classes = []
+    authentication_classes = []
+
+    def get(self, request, **kwargs):
+        query = request.query_params.get("q", "")
+        try:
+            composer_id = request.query_params.get("composer", None)
+            composer_id = int(composer_id) if composer_id else None
+            limit = int(request.query_params.get("limit", DEFAULT_SEARCH_LIMIT))
+        except ValueError:
+            return Response(
+                {"detail": "composer and limit must be integers"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+
+        works = get_work_index().search(query, composer_id=composer_id, limit=limit)
+        return Response([work.as_dict() for work in works], status=status.HTTP_200_OK)
+
 
 class ComposerWorkRangeView(APIView):
     permission_classes = []
@@ -85,19 +269,22 @@ class ComposerWorkRangeView(APIView):
 
     def get(self, request, **kwargs):
         composer_id = kwargs.get("composer_id", None)
-        works_agg = Work.objects.filter(composer_id=composer_id).aggregate(
-            Min("composition_year"), Max("composition_year")
-        )
+        # stored on the composer by the scraper and the Work signal handlers
+        year_range = (
+            Composer.objects.filter(pk=composer_id)
+            .values("min_composition_year", "max_composition_year")
+            .first()
+        ) or {}
 
         return Response(
             {
-                "min": works_agg["composition_year__min"],
-                "max": works_agg["composition_year__max"],
+                "min": year_range.get("min_composition_year", None),
+                "max": year_range.get("max_composition_year", None),
             }
         )
 
 
-class LatestPuzzleByCategoryView(APIView):
+class LatestPuzzleByCategoryView(CacheUntilRolloverMixin, APIView):
     permission_classes = []
     authentication_classes = []
 
@@ -113,24 +300,46 @@ class LatestPuzzleByCategoryView(APIView):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            # use user-supplied timezone if valid, otherwise use US eastern time
-            timezone = self.request.query_params.get("timezone", None)
-            now_date = get_timezone_aware_date(timezone)
+            # user-supplied timezone if valid, otherwise US eastern time
+            now_date = get_request_date(request)
 
-            # get the latest puzzle with a date before or equal to today
-            puzzle = Puzzle.objects.filter(type=choice, date__lte=now_date).latest(
-                "date"
-            )
+            cache_key = (choice.value, now_date)
+            cached = latest_puzzle_cache.get(cache_key)
+            if cached is not None:
+                data, etag, last_modified = cached
+                if is_not_modified(request, etag, last_modified):
+                    return not_modified_response(etag, last_modified)
+            else:
+                # get the latest puzzle with a date before or equal to today
+                puzzle = (
+                    Puzzle.objects.select_related("answer__composer")
+                    .filter(type=choice, date__lte=now_date)
+                    .latest("date")
+                )
+                etag, last_modified = puzzle_version(puzzle, now_date)
+                if is_not_modified(request, etag, last_modified):
+                    return not_modified_response(etag, last_modified)
 
-            serializer = PuzzleSerializer(puzzle, context={"request": request})
+                serializer = PuzzleSerializer(puzzle, context={"request": request})
+                data = serializer.data
+                latest_puzzle_cache.set(cache_key, (data, etag, last_modified))
 
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            response = Response(data, status=status.HTTP_200_OK)
+            return set_validators(response, etag, last_modified)
         except Puzzle.DoesNotExist:
             return Response(
                 {"detail": "Puzzle not found."}, status=status.HTTP_404_NOT_FOUND
             )
 
 
+class MetricsView(APIView):
+    # internal counters (caches, usage event buffer, scraper), staff only
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, **kwargs):
+        return Response(collect_metrics(), status=status.HTTP_200_OK)
+
+
 class SimpleView(APIView):
     permission_classes = []
     authentication_classes = []
@@ -139,7 +348,7 @@ class SimpleView(APIView):
         return Response({"detail": "Simple view"}, status=status.HTTP_200_OK)
 
 
-class PuzzleBySequenceNumberView(APIView):
+class PuzzleBySequenceNumberView(CacheUntilRolloverMixin, APIView):
     permission_classes = []
     authentication_classes = []
 
@@ -166,31 +375,182 @@ class PuzzleBySequenceNumberView(APIView):
                 status=status.HTTP_404_NOT_FOUND,
             )
             try:
-                puzzle = Puzzle.objects.filter(type=choice).order_by("date")[
-                    int(sequence_number) - 1
-                ]
-            except IndexError:
+                puzzle = Puzzle.objects.select_related("answer__composer").get(
+                    type=choice, sequence_number=int(sequence_number)
+                )
+            except Puzzle.DoesNotExist:
                 return no_puzzle_found_response
 
+            now_date = get_request_date(request)
             if HIDE_NEW_PUZZLES:
                 # do not allow puzzles for dates after today to be returned
-                timezone = self.request.query_params.get("timezone", None)
-                now_date = get_timezone_aware_date(timezone)
-
                 if puzzle.date > now_date:
                     return no_puzzle_found_response
 
-            serializer = PuzzleSerializer(puzzle, context={"request": request})
+            # once a newer puzzle is visible, this one can never change again
+            # (short of an admin edit), so the CDN can keep it indefinitely
+            frontier = get_latest_visible_date(puzzle.type, now_date)
+            is_past = frontier is not None and puzzle.date < frontier
+
+            etag, last_modified = puzzle_version(puzzle, is_past)
+            if is_not_modified(request, etag, last_modified):
+                response = not_modified_response(etag, last_modified)
+            else:
+                serializer = PuzzleSerializer(puzzle, context={"request": request})
+
+                data = serializer.data
+                # Return the serialized data
+                response = Response(data, status=status.HTTP_200_OK)
+                set_validators(response, etag, last_modified)
 
-            data = serializer.data
-            # Return the serialized data
-            return Response(data, status=status.HTTP_200_OK)
+            return cache_forever(response) if is_past else response
         except Puzzle.DoesNotExist:
             return Response(
                 {"detail": "Puzzle not found."}, status=status.HTTP_404_NOT_FOUND
             )
 
 
+class PuzzleArchiveView(CacheUntilRolloverMixin, APIView):
+    permission_classes = []
+    authentication_classes = []
+
+    def get(self, request, **kwargs):
+        category = self.kwargs.get("category", None)
+        try:
+            choice = Puzzle.PuzzleType[category.upper()]
+        except KeyError:
+            return Response(
+                {"detail": "Invalid puzzle category"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        puzzles = Puzzle.objects.filter(type=choice)
+        try:
+            # optional inclusive range of sequence numbers
+            if "from" in request.query_params:
+                puzzles = puzzles.filter(
+                    sequence_number__gte=int(request.query_params["from"])
+                )
+            if "to" in request.query_params:
+                puzzles = puzzles.filter(
+                    sequence_number__lte=int(request.query_params["to"])
+                )
+        except ValueError:
+            return Response(
+                {"detail": "from and to must be sequence numbers"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if HIDE_NEW_PUZZLES:
+            puzzles = puzzles.filter(date__lte=get_request_date(request))
+
+        archive = list(
+            puzzles.order_by("sequence_number").values(
+                "id", "sequence_number", "date", "difficulty"
+            )
+        )
+        return Response(archive, status=status.HTTP_200_OK)
+
+
+class CatalogVersionView(APIView):
+    permission_classes = []
+    authentication_classes = []
+
+    def get(self, request, **kwargs):
+        return Response({"version": get_catalog().version}, status=status.HTTP_200_OK)
+
+
+class CatalogView(APIView):
+    """
+    Every composer and their works in one pre-rendered, pre-compressed payload.
+    Clients check /api/catalog/version and then fetch /api/catalog?v=<version>,
+    which shared caches may keep forever.
+    """
+
+    permission_classes = []
+    authentication_classes = []
+
+    def get(self, request, **kwargs):
+        catalog = get_catalog()
+        etag = f'"{catalog.version}"'
+        if is_not_modified(request, etag):
+            response = HttpResponseNotModified()
+        elif "gzip" in request.headers.get("Accept-Encoding", ""):
+            response = HttpResponse(catalog.gzip_body, content_type="application/json")
+            # GZipMiddleware leaves responses that already have an encoding alone
+            response["Content-Encoding"] = "gzip"
+        else:
+            response = HttpResponse(catalog.body, content_type="application/json")
+
+        response["ETag"] = etag
+        patch_vary_headers(response, ["Accept-Encoding"])
+        if request.query_params.get("v", None) == catalog.version:
+            cache_forever(response)
+        else:
+            response["Cache-Control"] = "public, max-age=0, s-maxage=60"
+        return response
+
+
+class PuzzleGuessView(APIView):
+    permission_classes = []
+    authentication_classes = []
+
+    def post(self, request, **kwargs):
+        serializer = GuessSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        puzzle_id = kwargs.get("puzzle_id", None)
+        # answers and works both come from in-memory snapshots, so scoring a guess
+        # does not touch the database
+        answer = get_puzzle_answer(puzzle_id)
+        if answer is None or (
+            HIDE_NEW_PUZZLES and answer.date > get_request_date(request)
+        ):
+            return Response(
+                {"detail": "Puzzle not found"}, status=status.HTTP_404_NOT_FOUND
+            )
+
+        guess = get_guessable_work(serializer.validated_data["work"])
+        if guess is None:
+            return Response(
+                {"detail": "Work not found"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        result = score_guess(guess, get_guessable_work(answer.answer_id))
+        record_usage_event(
+            UsageEvent.EventType.GUESS_MADE,
+            puzzle_id,
+            result,
+            serializer.validated_data.get("session_id", None),
+        )
+        return Response(result, status=status.HTTP_200_OK)
+
+
+class PuzzleStatsView(APIView):
+    permission_classes = []
+    authentication_classes = []
+
+    def get(self, request, **kwargs):
+        puzzle_id = kwargs.get("puzzle_id", None)
+        answer = get_puzzle_answer(puzzle_id)
+        if answer is None or (
+            HIDE_NEW_PUZZLES and answer.date > get_request_date(request)
+        ):
+            return Response(
+                {"detail": "Puzzle not found"}, status=status.HTTP_404_NOT_FOUND
+            )
+
+        # rolled up periodically by the rollup_puzzle_stats command
+        stats = PuzzleStats.objects.filter(puzzle_id=puzzle_id).first()
+        if stats is None:
+            stats = PuzzleStats(puzzle_id=puzzle_id)
+
+        response = Response(PuzzleStatsSerializer(stats).data)
+        patch_cache_control(response, public=True, max_age=STATS_MAX_AGE_SECONDS)
+        return response
+
+
 class UsageEventView(APIView):
     permission_classes = []
     authentication_classes = []
@@ -213,23 +573,70 @@ class UsageEventView(APIView):
                     {"detail": "Invalid event type"}, status=status.HTTP_400_BAD_REQUEST
                 )
 
-            if not Puzzle.objects.filter(id=puzzle).exists():
+            if not puzzle_exists(puzzle):
                 return Response(
                     {"detail": "Puzzle not found"}, status=status.HTTP_404_NOT_FOUND
                 )
 
-            if SKIP_USAGE_EVENT_WRITE:
-                print(
-                    f"Got usage event: {event_type_choice} for puzzle {puzzle}: {session_id} - {event_body}"
-                )
-            else:
-                UsageEvent.objects.create(
-                    event_type=event_type_choice,
-                    puzzle_id=puzzle,
-                    event_body=event_body,
-                    session_id=session_id,
-                )
+            # written in the background, see usage_events.UsageEventBuffer
+            record_usage_event(event_type_choice, puzzle, event_body, session_id)
 
-            return Response(status=status.HTTP_201_CREATED)
+            return Response(status=status.HTTP_202_ACCEPTED)
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class UsageEventBatchView(APIView):
+    permission_classes = []
+    authentication_classes = []
+
+    def post(self, request):
+        if not isinstance(request.data, list):
+            return Response(
+                {"detail": "Expected a list of events"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(request.data) > MAX_USAGE_EVENT_BATCH:
+            return Response(
+                {"detail": f"At most {MAX_USAGE_EVENT_BATCH} events per batch"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # a malformed event is reported by its index, it doesn't reject the batch
+        valid = []
+        errors = []
+        for index, item in enumerate(request.data):
+            serializer = UsageEventSerializer(data=item)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                errors.append({"index": index, "detail": serializer.errors})
+
+        existing = existing_puzzle_ids(data["puzzle"] for _, data in valid)
+
+        events = []
+        for index, data in valid:
+            try:
+                event_type_choice = UsageEvent.EventType[data["event_type"].upper()]
+            except KeyError:
+                errors.append({"index": index, "detail": "Invalid event type"})
+                continue
+            if data["puzzle"] not in existing:
+                errors.append({"index": index, "detail": "Puzzle not found"})
+                continue
+
+            events.append(
+                make_usage_event(
+                    event_type_choice,
+                    data["puzzle"],
+                    data["event_body"],
+                    data.get("session_id", None),
+                )
+            )
+
+        errors.sort(key=lambda error: error["index"])
+        accepted = record_usage_events(events)
+        return Response(
+            {"accepted": accepted, "dropped": len(events) - accepted, "errors": errors},
+            status=status.HTTP_202_ACCEPTED,
+        )
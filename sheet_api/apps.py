@@ -6,6 +6,10 @@ class SheetApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "sheet_api"
 
+    def ready(self):
+        # register signal handlers
+        from sheet_api import signals  # noqa: F401
+
 
 class MyAdminConfig(AdminConfig):
     default_site = "sheet_api.admin.MyAdminSite"
@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+from django.core.cache import caches
+from django.db import connections
+
+from sheet_api.metrics import register_collector
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache with hit/miss counters.
+
+    If shared_alias names a Django cache (e.g. redis or memcached), entries are also
+    written there so other workers can reuse them, and clear() invalidates them for
+    every worker by bumping a shared generation number that is part of each key.
+
+    With local_ttl, this worker's copy of an entry is only used for that many seconds,
+    which bounds how long it can miss changes made by other processes when there is
+    no shared cache to bump the generation in.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = 128,
+        shared_alias: str | None = None,
+        shared_timeout: int | None = 24 * 60 * 60,
+        local_ttl: float | None = None,
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.shared_alias = shared_alias
+        self.shared_timeout = shared_timeout
+        self.local_ttl = local_ttl
+
+        # key -> (generation, monotonic time stored, value)
+        self._entries: OrderedDict[Hashable, tuple[int, float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._local_generation = 0
+
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        register_collector(f"cache.{name}", self.stats)
+
+    @property
+    def _shared(self):
+        return caches[self.shared_alias] if self.shared_alias else None
+
+    def _generation(self) -> int:
+        if self._shared is None:
+            return self._local_generation
+        return self._shared.get_or_set(
+            f"{self.name}:generation", time.time_ns, timeout=None
+        )
+
+    def _shared_key(self, key: Hashable, generation: int) -> str:
+        # hash the key so it is safe for memcached (no spaces, bounded length)
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return f"{self.name}:{generation}:{digest}"
+
+    def get(self, key: Hashable) -> Any | None:
+        generation = self._generation()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == generation and self._is_live(entry):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+
+        if self._shared is not None:
+            value = self._shared.get(self._shared_key(key, generation))
+            if value is not None:
+                self._store_local(key, generation, value)
+                with self._lock:
+                    self.shared_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _is_live(self, entry: tuple[int, float, Any]) -> bool:
+        return self.local_ttl is None or time.monotonic() - entry[1] < self.local_ttl
+
+    def set(self, key: Hashable, value: Any):
+        generation = self._generation()
+        self._store_local(key, generation, value)
+        if self._shared is not None:
+            self._shared.set(
+                self._shared_key(key, generation), value, self.shared_timeout
+            )
+
+    def _store_local(self, key: Hashable, generation: int, value: Any):
+        with self._lock:
+            self._entries[key] = (generation, time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        generation = self._generation()
+        with self._lock:
+            self._entries.pop(key, None)
+        if self._shared is not None:
+            self._shared.delete(self._shared_key(key, generation))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._local_generation += 1
+            self.invalidations += 1
+
+        if self._shared is not None:
+            key = f"{self.name}:generation"
+            try:
+                self._shared.incr(key)
+            except ValueError:
+                # generation was evicted, start a fresh one that can't match old keys
+                self._shared.set(key, time.time_ns(), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
+
+
+class VersionedSnapshot:
+    """
+    A value that is expensive to build from the database (e.g. an index over every
+    work), held in memory and rebuilt when it goes stale.
+
+    invalidate() marks it stale for this worker (called from signals). Changes made by
+    other processes are noticed by comparing source_version(), a cheap query, at most
+    every check_seconds. While one request rebuilds, others keep using the old value.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        build: Callable[[], Any],
+        source_version: Callable[[], Hashable],
+        check_seconds: float = 60,
+    ):
+        self.name = name
+        self.build = build
+        self.source_version = source_version
+        self.check_seconds = check_seconds
+
+        self._value = None
+        self._version = None
+        self._stale = False
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+        self.builds = 0
+        self.last_build_seconds = None
+
+        register_collector(f"snapshot.{name}", self.stats)
+
+    def _is_fresh(self) -> bool:
+        return (
+            self._value is not None
+            and not self._stale
+            and time.monotonic() - self._checked_at < self.check_seconds
+        )
+
+    def get(self) -> Any:
+        if self._is_fresh():
+            return self._value
+
+        # read once: a warm() thread may fill it in between the checks below
+        value = self._value
+        if value is None:
+            # nothing to serve yet, wait for whoever is building
+            self._lock.acquire()
+        elif not self._lock.acquire(blocking=False):
+            # another thread is already refreshing, serve what we have
+            return value
+
+        try:
+            if self._is_fresh():
+                return self._value
+
+            version = self.source_version()
+            if self._value is None or self._stale or version != self._version:
+                # cleared before building, so an invalidation during the build sticks
+                self._stale = False
+                start = time.perf_counter()
+                self._value = self.build()
+                self.last_build_seconds = time.perf_counter() - start
+                self._version = version
+                self.builds += 1
+            self._checked_at = time.monotonic()
+            return self._value
+        finally:
+            self._lock.release()
+
+    def invalidate(self):
+        self._stale = True
+
+    def warm(self):
+        """
+        Build in a background thread, e.g. when a worker starts.
+        """
+        threading.Thread(target=self._warm, daemon=True).start()
+
+    def _warm(self):
+        try:
+            self.get()
+        except Exception as e:
+            print(f"Could not build {self.name}: {e}")
+        finally:
+            # database connections are per thread
+            connections.close_all()
+
+    def stats(self) -> dict:
+        return {
+            "builds": self.builds,
+            "last_build_seconds": self.last_build_seconds,
+            "stale": self._stale,
+        }
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+from dataclasses import dataclass
+
+from sheet_api.caching import VersionedSnapshot
+from sheet_api.composer_helpers import work_tables_version
+from sheet_api.models import Composer, Work
+
+
+@dataclass(frozen=True)
+class Catalog:
+    version: str
+    body: bytes
+    gzip_body: bytes
+
+
+def build_catalog() -> Catalog:
+    """
+    Every composer with all of their works, in one pass over each table.
+    """
+    composers = []
+    composers_by_id = {}
+    composer_fields = (
+        "id",
+        "full_name",
+        "first_name",
+        "last_name",
+        "catalog_prefix",
+        "born_year",
+        "died_year",
+    )
+    for composer in Composer.objects.order_by("id").values(*composer_fields):
+        composer["works"] = []
+        composers.append(composer)
+        composers_by_id[composer["id"]] = composer
+
+    work_fields = ("id", "work_title", "composition_year", "opus", "opus_number")
+    works = Work.objects.order_by("composer_id", "id").values(
+        "composer_id", *work_fields
+    )
+    for work in works.iterator(chunk_size=2000):
+        composer_id = work.pop("composer_id")
+        if composer_id not in composers_by_id:
+            # composer added (e.g. by a scrape) after we read the composers; the
+            # version has changed too, so the next check rebuilds with them
+            continue
+        composers_by_id[composer_id]["works"].append(work)
+
+    composers_json = json.dumps(composers, ensure_ascii=False, separators=(",", ":"))
+    version = hashlib.sha256(composers_json.encode()).hexdigest()[:16]
+    body = f'{{"version":"{version}","composers":{composers_json}}}'.encode()
+
+    return Catalog(
+        version=version,
+        body=body,
+        gzip_body=gzip.compress(body, compresslevel=9),
+    )
+
+
+catalog_snapshot = VersionedSnapshot("catalog", build_catalog, work_tables_version)
+
+
+def get_catalog() -> Catalog:
+    return catalog_snapshot.get()
+
+
+def invalidate_catalog():
+    catalog_snapshot.invalidate()
@@ -0,0 +1,65 @@
+import threading
+from contextlib import contextmanager
+
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+
+from sheet_api.models import Composer, Work
+
+_deferred = threading.local()
+
+
+def refresh_composer_work_stats(composer_id: int):
+    """
+    Recompute the composition year range and work count stored on a composer.
+    """
+    stats = Work.objects.filter(composer_id=composer_id).aggregate(
+        min_year=Min("composition_year"),
+        max_year=Max("composition_year"),
+        count=Count("id"),
+    )
+    Composer.objects.filter(pk=composer_id).update(
+        min_composition_year=stats["min_year"],
+        max_composition_year=stats["max_year"],
+        work_count=stats["count"],
+        # update() skips auto_now, and the composer's ETag depends on it
+        updated_at=timezone.now(),
+    )
+
+
+@contextmanager
+def defer_composer_work_stats():
+    """
+    Skip the per-work stats refresh done by the Work signal handlers, for callers
+    that save many works and refresh each composer once at the end.
+    """
+    _deferred.active = True
+    try:
+        yield
+    finally:
+        _deferred.active = False
+
+
+def composer_work_stats_deferred() -> bool:
+    return getattr(_deferred, "active", False)
+
+
+def work_tables_version() -> tuple:
+    """
+    Cheap version of the Work and Composer tables, which changes whenever the
+    scraper adds or rescans works, and on admin edits.
+    """
+    works = Work.objects.aggregate(
+        count=Count("id"), last=Max("last_scanned"), edited=Max("updated_at")
+    )
+    composers = Composer.objects.aggregate(
+        count=Count("id"), last=Max("last_scanned"), edited=Max("updated_at")
+    )
+    return (
+        works["count"],
+        works["last"],
+        works["edited"],
+        composers["count"],
+        composers["last"],
+        composers["edited"],
+    )
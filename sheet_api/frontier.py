@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import time
+from datetime import date, timedelta
+
+from django.db.models import Max
+from django.utils import timezone
+
+from sheet_api.models import Puzzle
+from sheet_musicle_server.settings import HIDE_NEW_PUZZLES
+
+# signals clear this worker's frontier immediately, but other gunicorn workers only
+# notice admin edits once their entry expires
+FRONTIER_TTL_SECONDS = 300
+
+# (puzzle type, local date) -> (latest visible puzzle date, monotonic expiry time)
+_frontier_cache: dict[tuple[str, date], tuple[date | None, float]] = {}
+
+
+def get_latest_visible_date(puzzle_type: str, today: date) -> date | None:
+    """
+    Date of the newest puzzle of this type that a user can currently see.
+    With HIDE_NEW_PUZZLES this is the newest puzzle dated on or before today,
+    otherwise it is simply the newest puzzle.
+    """
+    key = (puzzle_type, today)
+    cached = _frontier_cache.get(key)
+    if cached is not None and cached[1] > time.monotonic():
+        return cached[0]
+
+    # one grouped query fills in every type, so serializing a mixed list of
+    # puzzles costs at most one frontier query
+    puzzles = Puzzle.objects.all()
+    if HIDE_NEW_PUZZLES:
+        puzzles = puzzles.filter(date__lte=today)
+    frontiers = dict(
+        puzzles.values("type")
+        .annotate(latest=Max("date"))
+        .values_list("type", "latest")
+    )
+
+    # users in different timezones can be a day apart, so the previous UTC day is
+    # still someone's today; anything older is never read again
+    oldest_live_date = timezone.now().date() - timedelta(days=1)
+    for stale_key in [k for k in _frontier_cache if k[1] < oldest_live_date]:
+        _frontier_cache.pop(stale_key, None)
+    expires = time.monotonic() + FRONTIER_TTL_SECONDS
+    for choice in Puzzle.PuzzleType.values:
+        _frontier_cache[(choice, today)] = (frontiers.get(choice, None), expires)
+
+    return frontiers.get(puzzle_type, None)
+
+
+def invalidate_frontier():
+    _frontier_cache.clear()
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+from sheet_api.models import Work
+from sheet_api.work_index import IndexedWork, get_work_index, tokenize
+
+
+def get_guessable_work(work_id: int) -> IndexedWork | None:
+    work = get_work_index().works.get(work_id, None)
+    if work is not None:
+        return work
+
+    # only hit while the index is rebuilding after works were added
+    row = (
+        Work.objects.filter(pk=work_id)
+        .values(
+            "id", "composer_id", "work_title", "composition_year", "opus", "opus_number"
+        )
+        .first()
+    )
+    if row is None:
+        return None
+    return IndexedWork(folded_title="", tokens=frozenset(), **row)
+
+
+def catalog_prefix(opus: str) -> str | None:
+    """
+    Name of the catalog an opus belongs to, e.g. "k" for "K. 525" or "bwv" for
+    "BWV 1007". None for bare numbers and empty strings.
+    """
+    tokens = tokenize(opus)
+    if not tokens or tokens[0].isdigit():
+        return None
+    # "Op.27" tokenizes as one token
+    return tokens[0].rstrip("0123456789") or None
+
+
+def score_guess(guess: IndexedWork, answer: IndexedWork) -> dict:
+    year_difference = None
+    if guess.composition_year and answer.composition_year:
+        # positive means the answer was written later than the guess
+        year_difference = answer.composition_year - guess.composition_year
+
+    guess_catalog = catalog_prefix(guess.opus)
+    return {
+        "work": guess.id,
+        "correct": guess.id == answer.id,
+        "composer_correct": guess.composer_id == answer.composer_id,
+        "year_difference": year_difference,
+        "same_catalog": guess_catalog is not None
+        and guess_catalog == catalog_prefix(answer.opus),
+    }
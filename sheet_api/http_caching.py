@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import hashlib
+from datetime import datetime
+
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+from sheet_api.time_helpers import get_next_rollover
+
+# for responses that never change once published, e.g. past puzzles
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def make_etag(*parts) -> str:
+    """
+    Strong ETag built from whatever identifies the current version of a response,
+    e.g. row ids and last change times.
+    """
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def _strip_weak(etag: str) -> str:
+    # GZipMiddleware weakens our ETags when it compresses, so compare weakly
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def is_not_modified(request, etag: str, last_modified: datetime | None = None) -> bool:
+    if_none_match = request.headers.get("If-None-Match", None)
+    if if_none_match:
+        client_etags = [_strip_weak(e) for e in parse_etags(if_none_match)]
+        return "*" in client_etags or etag in client_etags
+
+    if_modified_since = request.headers.get("If-Modified-Since", None)
+    if if_modified_since and last_modified is not None:
+        since = parse_http_date_safe(if_modified_since)
+        return since is not None and int(last_modified.timestamp()) <= since
+
+    return False
+
+
+def set_validators(
+    response, etag: str, last_modified: datetime | None = None
+) -> Response:
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+    return response
+
+
+def not_modified_response(etag: str, last_modified: datetime | None = None) -> Response:
+    return set_validators(
+        Response(status=status.HTTP_304_NOT_MODIFIED), etag, last_modified
+    )
+
+
+def puzzle_version(puzzle, *extra) -> tuple[str, datetime]:
+    """
+    ETag and Last-Modified for a serialized puzzle, including its nested answer.
+    The puzzle should be loaded with select_related("answer__composer").
+    """
+    work = puzzle.answer
+    composer = work.composer
+    etag = make_etag(
+        puzzle.id,
+        puzzle.updated_at.isoformat(),
+        puzzle.sequence_number,
+        work.id,
+        work.last_scanned.isoformat(),
+        work.updated_at.isoformat(),
+        composer.last_scanned.isoformat(),
+        composer.updated_at.isoformat(),
+        *extra,
+    )
+    last_modified = max(
+        puzzle.updated_at,
+        work.last_scanned,
+        work.updated_at,
+        composer.last_scanned,
+        composer.updated_at,
+    )
+    return etag, last_modified
+
+
+def latest_of(*values: datetime | None) -> datetime | None:
+    return max((value for value in values if value is not None), default=None)
+
+
+class ConditionalGetMixin:
+    """
+    Adds ETag/Last-Modified validators to ReadOnlyModelViewSet list and retrieve,
+    answering 304 before anything is serialized.
+
+    The version of a list is the row count plus the newest etag_version_field,
+    which is a single aggregate query.
+    """
+
+    etag_version_field = None
+
+    def get_etag_extra(self, request) -> tuple:
+        # anything else that changes the response, e.g. the user's local date
+        return ()
+
+    def get_list_version(self, queryset) -> dict:
+        # must include last_modified; every other value is only hashed into the ETag
+        return queryset.aggregate(
+            count=Count("pk"), last_modified=Max(self.etag_version_field)
+        )
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        version = self.get_list_version(queryset)
+        last_modified = version["last_modified"]
+        etag = make_etag(
+            request.get_full_path(),
+            *sorted(version.items()),
+            *self.get_etag_extra(request),
+        )
+        if is_not_modified(request, etag, last_modified):
+            return not_modified_response(etag, last_modified)
+
+        response = super().list(request, *args, **kwargs)
+        return set_validators(response, etag, last_modified)
+
+    def get_instance_version(self, request, instance) -> tuple[str, datetime]:
+        last_modified = getattr(instance, self.etag_version_field)
+        etag = make_etag(
+            instance.pk, last_modified.isoformat(), *self.get_etag_extra(request)
+        )
+        return etag, last_modified
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag, last_modified = self.get_instance_version(request, instance)
+        if is_not_modified(request, etag, last_modified):
+            return not_modified_response(etag, last_modified)
+
+        serializer = self.get_serializer(instance)
+        return set_validators(Response(serializer.data), etag, last_modified)
+
+
+def seconds_until_rollover(request) -> int:
+    clock = getattr(request, "clock", None)
+    next_rollover = clock.next_rollover if clock else get_next_rollover()
+    return max(0, int((next_rollover - timezone.now()).total_seconds()))
+
+
+def cache_until_rollover(response, request):
+    """
+    Let shared caches (the CDN) keep the response until the user's local midnight,
+    when the next puzzle becomes visible. Browsers revalidate with the ETag instead,
+    so admin edits still reach them.
+
+    The timezone is a query param and so already part of the CDN's cache key,
+    which is why no Vary header is needed for it.
+    """
+    seconds = seconds_until_rollover(request)
+    response["Cache-Control"] = f"public, max-age=0, s-maxage={seconds}"
+    return response
+
+
+def cache_forever(response):
+    response[
+        "Cache-Control"
+    ] = f"public, max-age={IMMUTABLE_MAX_AGE}, s-maxage={IMMUTABLE_MAX_AGE}, immutable"
+    return response
+
+
+class CacheUntilRolloverMixin:
+    """
+    Adds cache_until_rollover to successful responses of an APIView, unless the view
+    already chose its own Cache-Control.
+    """
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        cacheable = response.status_code in (
+            status.HTTP_200_OK,
+            status.HTTP_304_NOT_MODIFIED,
+        )
+        if cacheable and not response.has_header("Cache-Control"):
+            cache_until_rollover(response, request)
+        return response
@@ -0,0 +1,111 @@
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from sheet_api.models import Composer, Puzzle, Work
+from sheet_api.sequence_helpers import renumber_puzzles
+
+# far enough in the past to never collide with real puzzle dates
+BENCH_START_DATE = date(1800, 1, 1)
+
+
+def time_ms(func) -> float:
+    start = time.perf_counter()
+    func()
+    return (time.perf_counter() - start) * 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare stored sequence number lookups against the old COUNT/OFFSET queries "
+        "at increasing archive sizes. All rows are created in a transaction that is "
+        "rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            default="1000,10000,50000",
+            help="Comma separated puzzle counts to benchmark",
+        )
+        parser.add_argument(
+            "--lookups", type=int, default=200, help="Lookups to time per size"
+        )
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options["sizes"].split(",")]
+        lookups = options["lookups"]
+
+        self.stdout.write(
+            f"{'puzzles':>8} {'backfill ms':>12} "
+            f"{'stored p50':>11} {'stored p95':>11} "
+            f"{'offset p50':>11} {'offset p95':>11} "
+            f"{'count p50':>10} {'count p95':>10}"
+        )
+        for size in sizes:
+            with transaction.atomic():
+                self._bench_size(size, lookups)
+                transaction.set_rollback(True)
+
+    def _bench_size(self, size: int, lookups: int):
+        composer = Composer.objects.create(
+            full_name="Bench Composer", first_name="Bench", last_name="Composer"
+        )
+        work = Work.objects.create(
+            work_title="Bench Work",
+            composition_year=1800,
+            opus="Bench",
+            composer=composer,
+        )
+        puzzle_type = Puzzle.PuzzleType.PIANO
+        Puzzle.objects.bulk_create(
+            [
+                Puzzle(
+                    type=puzzle_type,
+                    date=BENCH_START_DATE + timedelta(days=i),
+                    answer=work,
+                    sheet_image_url="",
+                )
+                for i in range(size)
+            ],
+            batch_size=1000,
+        )
+
+        backfill_ms = time_ms(lambda: renumber_puzzles(puzzle_type))
+        # sample positions across the whole archive, including the newest puzzles
+        total = Puzzle.objects.filter(type=puzzle_type).count()
+        positions = [random.randint(1, total) for _ in range(lookups)]
+
+        stored, offset, count = [], [], []
+        for n in positions:
+            stored.append(
+                time_ms(lambda: Puzzle.objects.get(type=puzzle_type, sequence_number=n))
+            )
+            offset_puzzle = Puzzle.objects.filter(type=puzzle_type).order_by("date")
+            offset.append(time_ms(lambda: offset_puzzle[n - 1]))
+
+            puzzle_date = BENCH_START_DATE + timedelta(days=min(n, size) - 1)
+            count.append(
+                time_ms(
+                    lambda: Puzzle.objects.filter(
+                        type=puzzle_type, date__lte=puzzle_date
+                    ).count()
+                )
+            )
+
+        def p50(samples):
+            return statistics.median(samples)
+
+        def p95(samples):
+            return statistics.quantiles(samples, n=20)[-1]
+
+        self.stdout.write(
+            f"{size:>8} {backfill_ms:>12.1f} "
+            f"{p50(stored):>11.3f} {p95(stored):>11.3f} "
+            f"{p50(offset):>11.3f} {p95(offset):>11.3f} "
+            f"{p50(count):>10.3f} {p95(count):>10.3f}"
+        )
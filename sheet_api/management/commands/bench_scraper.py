@@ -0,0 +1,177 @@
+import contextlib
+import hashlib
+import io
+import itertools
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+from django.core.management.base import BaseCommand
+
+from sheet_api.scraper import page_helpers
+from sheet_api.scraper.page_helpers import (
+    HostRateLimiter,
+    configure_page_cache,
+    fetch_stats,
+)
+from sheet_api.scraper.scraper import Parser, config_by_composer
+
+WORKS_PATH_PREFIX = "/wiki/List_of_works_by_"
+
+
+def synthetic_works_page(works: int) -> bytes:
+    """
+    A page shaped like an IMSLP works list, with the columns the scraper reads.
+    """
+    rows = [
+        "<tr><th>Opus</th><th>Title</th><th>Key</th><th>Date</th></tr>",
+        *(
+            f"<tr><td>Op.{i}</td><td>Sonata No.{i}</td><td>C major</td>"
+            f"<td>{1800 + i % 100}</td></tr>"
+            for i in range(1, works + 1)
+        ),
+    ]
+    table = f'<table class="wikitable sortable">{"".join(rows)}</table>'
+    return f"<html><body>{table}</body></html>".encode()
+
+
+def make_handler(latency: float, pages_dir: str | None, works: int, fail_every: int):
+    synthetic = synthetic_works_page(works)
+    requests_seen = itertools.count(1)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            if fail_every and next(requests_seen) % fail_every == 0:
+                self.send_response(503)
+                self.send_header("Retry-After", "0")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            body = synthetic
+            if pages_dir and self.path.startswith(WORKS_PATH_PREFIX):
+                name = unquote(self.path[len(WORKS_PATH_PREFIX) :])
+                saved = os.path.join(pages_dir, f"{name}.html")
+                if os.path.exists(saved):
+                    with open(saved, "rb") as f:
+                        body = f.read()
+
+            etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+            if self.headers.get("If-None-Match", None) == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class Command(BaseCommand):
+    help = (
+        "Time a full dry-run scrape against a local stand-in for IMSLP that adds "
+        "latency to every page, with different numbers of workers"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            default="1,4,8",
+            help="Comma separated worker counts to compare",
+        )
+        parser.add_argument(
+            "--latency", type=float, default=0.3, help="Seconds added to every page"
+        )
+        parser.add_argument(
+            "--pages-dir",
+            help="Serve <Composer_Name>.html from here instead of a synthetic page",
+        )
+        parser.add_argument(
+            "--works", type=int, default=100, help="Rows on the synthetic page"
+        )
+        parser.add_argument("--composers", type=int, default=40)
+        parser.add_argument(
+            "--min-interval",
+            type=float,
+            default=0.05,
+            help="Per host politeness interval for the run",
+        )
+        parser.add_argument("--max-per-host", type=int, default=8)
+        parser.add_argument(
+            "--cache-dir",
+            help="Cache pages here, so runs after the first only revalidate them",
+        )
+        parser.add_argument(
+            "--offline",
+            action="store_true",
+            help="With --cache-dir, finish with a run replayed from the cache",
+        )
+        parser.add_argument(
+            "--fail-every",
+            type=int,
+            default=0,
+            help="Answer every Nth request with a 503, to exercise retries",
+        )
+
+    def handle(self, *args, **options):
+        handler = make_handler(
+            options["latency"],
+            options["pages_dir"],
+            options["works"],
+            options["fail_every"],
+        )
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        works_url = f"http://127.0.0.1:{server.server_port}{WORKS_PATH_PREFIX}{{}}"
+
+        # composers with overrides scrape other sites or expect their own columns
+        composers = [
+            composer
+            for composer in Parser().composer_list
+            if composer not in config_by_composer
+        ][: options["composers"]]
+
+        runs = [(int(w), False) for w in options["workers"].split(",")]
+        if options["offline"] and options["cache_dir"]:
+            runs.append((runs[-1][0], True))
+
+        baseline = None
+        try:
+            for workers, replay_only in runs:
+                page_helpers.host_rate_limiter = HostRateLimiter(
+                    options["min_interval"], options["max_per_host"]
+                )
+                configure_page_cache(options["cache_dir"], replay_only)
+                scraper = Parser(writes_to_db=False, works_url=works_url)
+                fetch_stats.reset()
+
+                start = time.perf_counter()
+                # the dry run prints every work; force, so every page gets parsed
+                with contextlib.redirect_stdout(io.StringIO()):
+                    failed = scraper.scrape_all_composers(
+                        workers, composers, force=True
+                    )
+                elapsed = time.perf_counter() - start
+
+                baseline = baseline or elapsed
+                label = "offline" if replay_only else f"{workers:>3} workers"
+                self.stdout.write(
+                    f"{label}: {len(composers)} composers in "
+                    f"{elapsed:6.2f}s ({baseline / elapsed:4.1f}x), {len(failed)} failed"
+                )
+                self.stdout.write(f"    {fetch_stats.summary()}")
+        finally:
+            server.shutdown()
+            configure_page_cache(None)
@@ -0,0 +1,110 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from sheet_api.models import Composer, Work
+from sheet_api.work_index import build_work_index, tokenize
+
+SYNTHETIC_FORMS = [
+    "Symphony",
+    "Piano Sonata",
+    "String Quartet",
+    "Sérénade",
+    "Mazurka",
+    "Nocturne",
+    "Concerto",
+    "Étude",
+]
+SYNTHETIC_KEYS = ["C major", "D minor", "E-flat major", "F-sharp minor", "A major"]
+
+
+def time_us(func) -> float:
+    start = time.perf_counter()
+    func()
+    return (time.perf_counter() - start) * 1_000_000
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the in-memory work search index against an ORM icontains query. "
+        "With --synthetic, generated works are added in a transaction that is "
+        "rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--synthetic",
+            type=int,
+            default=0,
+            help="Add this many generated works before benchmarking",
+        )
+        parser.add_argument("--queries", type=int, default=500)
+        parser.add_argument("--limit", type=int, default=10)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options["synthetic"]:
+                self._create_works(options["synthetic"])
+            self._bench(options["queries"], options["limit"])
+            transaction.set_rollback(True)
+
+    def _create_works(self, count: int):
+        composers = [
+            Composer.objects.create(
+                full_name=f"Bench Composer {i}",
+                first_name="Bench",
+                last_name=f"Composer {i}",
+            )
+            for i in range(20)
+        ]
+        Work.objects.bulk_create(
+            [
+                Work(
+                    work_title=f"{random.choice(SYNTHETIC_FORMS)} No. {i % 50 + 1} in "
+                    f"{random.choice(SYNTHETIC_KEYS)} (bench {i})",
+                    composition_year=1700 + i % 250,
+                    opus=f"Op. {i}",
+                    opus_number=i % 5 or None,
+                    composer=composers[i % len(composers)],
+                )
+                for i in range(count)
+            ],
+            batch_size=2000,
+        )
+
+    def _bench(self, query_count: int, limit: int):
+        start = time.perf_counter()
+        index = build_work_index()
+        build_ms = (time.perf_counter() - start) * 1000
+        self.stdout.write(f"Indexed {len(index.works)} works in {build_ms:.0f} ms")
+        if not index.works:
+            self.stdout.write("No works to search, try --synthetic")
+            return
+
+        # queries as a user would type them: the start of a word or two of a title
+        titles = [work.work_title for work in index.works.values()]
+        queries = []
+        for _ in range(query_count):
+            words = tokenize(random.choice(titles))
+            query = " ".join(words[: random.randint(1, 2)])
+            queries.append(query[: random.randint(3, max(3, len(query)))])
+
+        index_us, orm_us = [], []
+        for query in queries:
+            index_us.append(time_us(lambda: index.search(query, limit=limit)))
+            orm_us.append(
+                time_us(
+                    lambda: list(
+                        Work.objects.filter(work_title__icontains=query)[:limit]
+                    )
+                )
+            )
+
+        for label, samples in (("index", index_us), ("orm icontains", orm_us)):
+            self.stdout.write(
+                f"{label:>14}: p50 {statistics.median(samples):8.1f} us, "
+                f"p95 {statistics.quantiles(samples, n=20)[-1]:8.1f} us"
+            )
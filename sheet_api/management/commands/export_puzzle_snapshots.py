@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+
+import boto3
+from django.core.management.base import BaseCommand, CommandError
+
+from sheet_api import s3
+from sheet_api.snapshots import MANIFEST_PATH, content_hash, render_snapshots
+
+
+class LocalSnapshotStore:
+    def __init__(self, root: str):
+        self.root = root
+
+    def read(self, path: str) -> bytes | None:
+        try:
+            with open(os.path.join(self.root, path), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def write(self, path: str, body: bytes):
+        full_path = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        # the directory may be served while we export, never expose half a file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(full_path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(body)
+            os.replace(tmp_path, full_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def delete(self, path: str):
+        try:
+            os.remove(os.path.join(self.root, path))
+        except FileNotFoundError:
+            pass
+
+
+class S3SnapshotStore:
+    def __init__(self, prefix: str):
+        self.prefix = prefix.strip("/")
+        self.client = boto3.client("s3")
+
+    def _key(self, path: str) -> str:
+        return f"{self.prefix}/{path}" if self.prefix else path
+
+    def read(self, path: str) -> bytes | None:
+        return s3.download_file(self._key(path), self.client)
+
+    def write(self, path: str, body: bytes):
+        s3.upload_json_file(self._key(path), body, self.client)
+
+    def delete(self, path: str):
+        s3.delete_file(self._key(path), self.client)
+
+
+class Command(BaseCommand):
+    help = (
+        "Pre-render every visible puzzle to static JSON in a local directory or the "
+        "S3 bucket. Only files whose content changed since the last run are written."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output-dir", help="Write snapshots to this directory")
+        parser.add_argument(
+            "--s3-prefix",
+            help=f"Write snapshots to this prefix of the {s3.BUCKET_NAME} bucket",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Rewrite every file, even if the manifest says it is unchanged",
+        )
+
+    def handle(self, *args, **options):
+        if bool(options["output_dir"]) == bool(options["s3_prefix"] is not None):
+            raise CommandError("Pass exactly one of --output-dir or --s3-prefix")
+
+        if options["output_dir"]:
+            store = LocalSnapshotStore(options["output_dir"])
+        else:
+            store = S3SnapshotStore(options["s3_prefix"])
+
+        # path -> content hash of what was written last time
+        manifest_body = store.read(MANIFEST_PATH)
+        previous = {} if manifest_body is None else json.loads(manifest_body)
+        if options["force"]:
+            previous = {}
+
+        files = render_snapshots()
+        manifest = {}
+        written = 0
+        for path, body in files.items():
+            manifest[path] = content_hash(body)
+            if previous.get(path) != manifest[path]:
+                store.write(path, body)
+                written += 1
+
+        # puzzles can be deleted or moved to a different sequence number
+        stale = [path for path in previous if path not in manifest]
+        for path in stale:
+            store.delete(path)
+
+        store.write(MANIFEST_PATH, json.dumps(manifest, sort_keys=True).encode())
+        self.stdout.write(
+            f"Rendered {len(files)} files: {written} written, "
+            f"{len(files) - written} unchanged, {len(stale)} deleted"
+        )
@@ -0,0 +1,122 @@
+import gzip
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from django.utils import timezone
+
+from sheet_api.models import RollupCursor, UsageEvent
+from sheet_api.partitions import (
+    add_months,
+    drop_partition,
+    ensure_partitions,
+    expired_months,
+    is_partitioned,
+    list_partitions,
+    month_bounds,
+    partition_name,
+)
+from sheet_api.stats_rollup import PUZZLE_STATS_CURSOR
+from sheet_api.usage_event_export import iter_usage_event_rows, write_ndjson
+
+
+class Command(BaseCommand):
+    help = (
+        "Maintain the monthly usage event partitions: create upcoming ones, and "
+        "archive partitions older than the retention period to gzipped NDJSON "
+        "before dropping them. Meant to be run daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--keep-months",
+            type=int,
+            default=6,
+            help="Keep this many whole months before the current one",
+        )
+        parser.add_argument(
+            "--months-ahead",
+            type=int,
+            default=3,
+            help="Make sure partitions exist this many months ahead",
+        )
+        parser.add_argument(
+            "--archive-dir",
+            default="usage_event_archive",
+            help="Directory the archived partitions are written to",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only list the partitions that would be archived and dropped",
+        )
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            raise CommandError(
+                "The usage event table is not partitioned (PostgreSQL only)"
+            )
+
+        today = timezone.now().date()
+        if not options["dry_run"]:
+            for month in ensure_partitions(today, options["months_ahead"]):
+                self.stdout.write(f"Created {partition_name(month)}")
+
+        expired = expired_months(list_partitions(), today, options["keep_months"])
+        if not expired:
+            cutoff = add_months(today.replace(day=1), -options["keep_months"])
+            self.stdout.write(f"No partitions before {cutoff} to archive")
+            return
+
+        os.makedirs(options["archive_dir"], exist_ok=True)
+        for month in expired:
+            name = partition_name(month)
+            if options["dry_run"]:
+                self.stdout.write(f"Would archive and drop {name}")
+                continue
+            self.archive_and_drop(month, options["archive_dir"])
+
+    def archive_and_drop(self, month, archive_dir: str):
+        name = partition_name(month)
+        start, end = month_bounds(month)
+        events = UsageEvent.objects.filter(event_time__gte=start, event_time__lt=end)
+
+        # dropping events the stats haven't counted yet would lose them for good
+        last_event_id = events.aggregate(last=Max("id"))["last"]
+        rolled_up = (
+            RollupCursor.objects.filter(name=PUZZLE_STATS_CURSOR)
+            .values_list("last_event_id", flat=True)
+            .first()
+        ) or 0
+        if last_event_id is not None and last_event_id > rolled_up:
+            self.stderr.write(
+                f"Skipping {name}: run rollup_puzzle_stats first "
+                f"(rolled up to {rolled_up}, partition goes up to {last_event_id})"
+            )
+            return
+
+        path = os.path.join(archive_dir, f"{name}.ndjson.gz")
+        partial_path = f"{path}.partial"
+        start_time = time.perf_counter()
+        with gzip.open(partial_path, "wt", encoding="utf-8") as out:
+            written = write_ndjson(iter_usage_event_rows(events), out)
+
+        # nothing writes events for past months, so this only differs if rows were
+        # deleted while exporting
+        expected = events.count()
+        if written != expected:
+            os.remove(partial_path)
+            self.stderr.write(
+                f"Skipping {name}: exported {written} rows but it has {expected}"
+            )
+            return
+
+        os.replace(partial_path, path)
+        drop_partition(month)
+        elapsed = time.perf_counter() - start_time
+        size_kb = os.path.getsize(path) / 1024
+        self.stdout.write(
+            f"Archived {written} events from {name} to {path} "
+            f"({size_kb:.0f} KiB) in {elapsed:.1f}s and dropped it"
+        )
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from sheet_api.models import Puzzle
+from sheet_api.sequence_helpers import renumber_puzzles
+
+
+class Command(BaseCommand):
+    help = "Backfill or repair the stored sequence numbers of every puzzle type"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--type",
+            choices=Puzzle.PuzzleType.values,
+            help="Only renumber puzzles of this type",
+        )
+
+    def handle(self, *args, **options):
+        puzzle_types = (
+            [options["type"]] if options["type"] else Puzzle.PuzzleType.values
+        )
+
+        for puzzle_type in puzzle_types:
+            with transaction.atomic():
+                changed = renumber_puzzles(puzzle_type)
+            label = Puzzle.PuzzleType(puzzle_type).label
+            self.stdout.write(f"{label}: updated {changed} sequence numbers")
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from sheet_api.stats_rollup import (
+    ROLLUP_BATCH_SIZE,
+    ROLLUP_LAG_SECONDS,
+    rollup_puzzle_stats,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Add usage events recorded since the last run to the per-puzzle stats. "
+        "Meant to be run periodically, e.g. every few minutes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=ROLLUP_BATCH_SIZE)
+        parser.add_argument(
+            "--lag",
+            type=float,
+            default=ROLLUP_LAG_SECONDS,
+            help="Leave events newer than this many seconds for the next run",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        processed = rollup_puzzle_stats(options["batch_size"], options["lag"])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"Rolled up {processed} usage events in {elapsed:.2f}s")
@@ -0,0 +1,87 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sheet_api.scraper.page_helpers import configure_page_cache, fetch_stats
+from sheet_api.scraper.scraper import Parser
+from sheet_musicle_server.settings import SCRAPER_CACHE_DIR, SCRAPER_OFFLINE
+
+
+class Command(BaseCommand):
+    help = (
+        "Scrape and save the works of every composer in all_composers.json, "
+        "fetching several pages at once"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--composer",
+            action="append",
+            help="Only scrape this composer (can be repeated)",
+        )
+        parser.add_argument("--start-at", help="Start at this composer in the list")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Pages fetched and parsed at once (per host limits still apply)",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Print works instead of saving them"
+        )
+        parser.add_argument(
+            "--row-by-row",
+            action="store_true",
+            help="Save works one query at a time instead of in bulk",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Parse and save composers even if their page hasn't changed",
+        )
+        parser.add_argument(
+            "--cache-dir",
+            default=SCRAPER_CACHE_DIR,
+            help="Cache pages here and revalidate them on the next scan",
+        )
+        parser.add_argument(
+            "--offline",
+            action="store_true",
+            default=SCRAPER_OFFLINE,
+            help="Only replay pages from the cache, without any requests",
+        )
+
+    def handle(self, *args, **options):
+        if options["offline"] and not options["cache_dir"]:
+            raise CommandError("--offline needs --cache-dir")
+        configure_page_cache(options["cache_dir"], options["offline"])
+
+        scraper = Parser(
+            writes_to_db=not options["dry_run"],
+            bulk_writes=not options["row_by_row"],
+        )
+        composers = scraper.composer_list
+        if options["composer"]:
+            unknown = set(options["composer"]) - set(composers)
+            if unknown:
+                raise CommandError(f"Composer not found: {', '.join(sorted(unknown))}")
+            composers = options["composer"]
+        if options["start_at"]:
+            if options["start_at"] not in composers:
+                raise CommandError(f"Composer not found: {options['start_at']}")
+            composers = composers[composers.index(options["start_at"]) :]
+
+        fetch_stats.reset()
+        start = time.perf_counter()
+        failed = scraper.scrape_all_composers(
+            options["workers"], composers, force=options["force"]
+        )
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(
+            f"Scraped {len(composers) - len(failed)} of {len(composers)} composers "
+            f"in {elapsed:.1f}s with {options['workers']} workers"
+        )
+        self.stdout.write(f"Fetched {fetch_stats.summary()}")
+        if failed:
+            self.stderr.write(f"Failed: {', '.join(failed)}")
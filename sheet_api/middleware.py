@@ -0,0 +1,15 @@
+from sheet_api.time_helpers import get_request_clock
+
+
+class RequestClockMiddleware:
+    """
+    Resolve the user's timezone (from the ?timezone= query param) and local date once
+    per request, so that views and serializers all agree on what "today" is.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.clock = get_request_clock(request.GET.get("timezone", None))
+        return self.get_response(request)
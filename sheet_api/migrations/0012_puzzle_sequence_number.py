@@ -0,0 +1,37 @@
+# Generated by Django 4.2.6 on 2026-10-17 23:10
+
+from django.db import migrations, models
+
+
+def backfill_sequence_numbers(apps, schema_editor):
+    Puzzle = apps.get_model("sheet_api", "Puzzle")
+
+    changed = []
+    for puzzle_type in Puzzle.objects.values_list("type", flat=True).distinct():
+        rows = Puzzle.objects.filter(type=puzzle_type).order_by("date")
+        for sequence_number, puzzle in enumerate(rows, start=1):
+            puzzle.sequence_number = sequence_number
+            changed.append(puzzle)
+
+    Puzzle.objects.bulk_update(changed, ["sequence_number"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sheet_api", "0011_puzzle_difficulty"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="puzzle",
+            name="sequence_number",
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="puzzle",
+            index=models.Index(
+                fields=["type", "sequence_number"], name="sheet_api_p_type_74e2e8_idx"
+            ),
+        ),
+        migrations.RunPython(backfill_sequence_numbers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.6 on 2026-10-17 23:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sheet_api", "0012_puzzle_sequence_number"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="puzzle",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.6 on 2026-10-18 00:40
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+
+
+def backfill_work_stats(apps, schema_editor):
+    Composer = apps.get_model("sheet_api", "Composer")
+    Work = apps.get_model("sheet_api", "Work")
+
+    stats = (
+        Work.objects.values("composer_id")
+        .annotate(
+            min_year=Min("composition_year"),
+            max_year=Max("composition_year"),
+            count=Count("id"),
+        )
+        .order_by()
+    )
+    for row in stats:
+        Composer.objects.filter(pk=row["composer_id"]).update(
+            min_composition_year=row["min_year"],
+            max_composition_year=row["max_year"],
+            work_count=row["count"],
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sheet_api", "0013_puzzle_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="composer",
+            name="max_composition_year",
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="composer",
+            name="min_composition_year",
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="composer",
+            name="work_count",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_work_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.6 on 2026-10-17 23:23
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sheet_api", "0014_composer_work_stats"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="usageevent",
+            name="event_time",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
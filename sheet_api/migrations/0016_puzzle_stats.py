@@ -0,0 +1,50 @@
+# Generated by Django 4.2.6 on 2026-10-17 23:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sheet_api", "0015_usageevent_event_time_default"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PuzzleStats",
+            fields=[
+                (
+                    "puzzle",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to="sheet_api.puzzle",
+                    ),
+                ),
+                ("views", models.PositiveIntegerField(default=0)),
+                ("solves", models.PositiveIntegerField(default=0)),
+                ("fails", models.PositiveIntegerField(default=0)),
+                ("guesses", models.PositiveIntegerField(default=0)),
+                ("solve_guess_counts", models.JSONField(default=dict)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="RollupCursor",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=50, unique=True)),
+                ("last_event_id", models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
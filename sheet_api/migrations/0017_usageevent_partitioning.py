@@ -0,0 +1,105 @@
+# Generated by Django 4.2.6 on 2026-10-17 23:27
+
+from datetime import datetime, timezone
+
+from django.db import migrations, models
+
+TABLE = "sheet_api_usageevent"
+OLD_TABLE = "sheet_api_usageevent_unpartitioned"
+# months after the current one that get a partition up front, the
+# prune_usage_events command keeps creating them from then on
+MONTHS_AHEAD = 3
+
+
+def month_start(month_index: int) -> datetime:
+    # month_index counts months since year 0, so consecutive months are consecutive ints
+    year, month = divmod(month_index, 12)
+    return datetime(year, month + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_usage_events(apps, schema_editor):
+    """
+    Recreate the usage event table partitioned by month of event_time. Only on
+    PostgreSQL; other databases (e.g. sqlite in development) keep a plain table.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = %s "
+            "AND indexname NOT LIKE '%%_pkey'",
+            [TABLE],
+        )
+        index_definitions = [row[0] for row in cursor.fetchall()]
+        cursor.execute(f"SELECT min(event_time) FROM {TABLE}")
+        oldest = cursor.fetchone()[0] or datetime.now(timezone.utc)
+
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {OLD_TABLE}")
+        # the partition key has to be part of the primary key
+        cursor.execute(
+            f"""
+            CREATE TABLE {TABLE} (
+                id bigint NOT NULL,
+                event_type varchar(20) NOT NULL,
+                event_body jsonb NOT NULL,
+                event_time timestamp with time zone NOT NULL,
+                puzzle_id bigint NOT NULL
+                    CONSTRAINT {TABLE}_puzzle_id_fk REFERENCES sheet_api_puzzle (id)
+                    DEFERRABLE INITIALLY DEFERRED,
+                session_id varchar(36) NULL,
+                PRIMARY KEY (id, event_time)
+            ) PARTITION BY RANGE (event_time)
+            """
+        )
+        cursor.execute(f"CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT")
+
+        now = datetime.now(timezone.utc)
+        first = oldest.year * 12 + oldest.month - 1
+        last = now.year * 12 + now.month - 1 + MONTHS_AHEAD
+        for month_index in range(first, last + 1):
+            start = month_start(month_index)
+            cursor.execute(
+                f"CREATE TABLE {TABLE}_p{start.year:04d}_{start.month:02d} "
+                f"PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)",
+                [start, month_start(month_index + 1)],
+            )
+
+        cursor.execute(
+            f"INSERT INTO {TABLE} "
+            f"(id, event_type, event_body, event_time, puzzle_id, session_id) "
+            f"SELECT id, event_type, event_body, event_time, puzzle_id, session_id "
+            f"FROM {OLD_TABLE}"
+        )
+        # also drops the old identity sequence and indexes, freeing their names
+        cursor.execute(f"DROP TABLE {OLD_TABLE}")
+
+        cursor.execute(f"CREATE SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id")
+        cursor.execute(
+            f"SELECT setval('{TABLE}_id_seq', coalesce(max(id), 0) + 1, false) "
+            f"FROM {TABLE}"
+        )
+        cursor.execute(
+            f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{TABLE}_id_seq')"
+        )
+
+        # same names as before, so later migrations can still find them
+        for definition in index_definitions:
+            cursor.execute(definition)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sheet_api", "0016_puzzle_stats"),
+    ]
+
+    operations = [
+        # reversing leaves the table partitioned, which the model works with as is
+        migrations.RunPython(partition_usage_events, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="usageevent",
+            index=models.Index(
+                fields=["event_time"], name="sheet_api_u_event_t_ac2c89_idx"
+            ),
+        ),
+    ]
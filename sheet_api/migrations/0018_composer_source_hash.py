@@ -0,0 +1,26 @@
+# Generated by Django 4.2.6 on 2026-10-17 23:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sheet_api", "0017_usageevent_partitioning"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="composer",
+            name="config_version",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=64
+            ),
+        ),
+        migrations.AddField(
+            model_name="composer",
+            name="source_hash",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=64
+            ),
+        ),
+    ]
@@ -27,7 +27,10 @@ class Puzzle(models.Model):
             )
         ]
 
-        indexes = [models.Index(fields=["type", "date"])]
+        indexes = [
+            models.Index(fields=["type", "date"]),
+            models.Index(fields=["type", "sequence_number"]),
+        ]
 
     type = models.CharField(max_length=5, choices=PuzzleType.choices)
     date = models.DateField()
@@ -36,6 +39,10 @@ class Puzzle(models.Model):
         choices=DifficultyRating.choices, default=DifficultyRating.MEDIUM
     )
     sheet_image_url = models.CharField(max_length=200)
+    # 1-based position of this puzzle within its type, ordered by date.
+    # kept up to date by the signal handlers in sheet_api.signals
+    sequence_number = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.date} [{self.difficulty}]: {self.answer}"
@@ -58,8 +65,24 @@ class Composer(models.Model):
     died_year = models.IntegerField(blank=True, null=True)
     catalog_prefix = models.CharField(max_length=10, blank=True, null=True)
 
+    # denormalized from this composer's works by sheet_api.composer_helpers
+    min_composition_year = models.IntegerField(blank=True, null=True, editable=False)
+    max_composition_year = models.IntegerField(blank=True, null=True, editable=False)
+    work_count = models.IntegerField(default=0, editable=False)
+
+    # what the last scan parsed: a hash of the source page, and a version of the code
+    # parsing it (see scraper.parser_config_version), so unchanged pages are skipped
+    source_hash = models.CharField(
+        max_length=64, blank=True, default="", editable=False
+    )
+    config_version = models.CharField(
+        max_length=64, blank=True, default="", editable=False
+    )
+
     first_scanned = models.DateTimeField(auto_now_add=True)
     last_scanned = models.DateTimeField(default=timezone.now)
+    # unlike last_scanned, also moves on admin edits and stats refreshes
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.full_name}"
@@ -83,6 +106,8 @@ class Work(models.Model):
 
     first_scanned = models.DateTimeField(auto_now_add=True)
     last_scanned = models.DateTimeField(default=timezone.now)
+    # unlike last_scanned, also moves on admin edits
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.composer.last_name}: {self.work_title} ({self.composition_year})"
@@ -95,8 +120,14 @@ class UsageEvent(models.Model):
         PUZZLE_SOLVED = "PUZZLE_SOLVED", _("Puzzle solved")
         PUZZLE_FAILED = "PUZZLE_FAILED", _("Puzzle failed")
 
+    # on PostgreSQL the table is partitioned by month of event_time (see partitions.py),
+    # so the database's primary key is (id, event_time); ids still come from one sequence
     class Meta:
-        indexes = [models.Index(fields=["event_type"]), models.Index(fields=["puzzle"])]
+        indexes = [
+            models.Index(fields=["event_type"]),
+            models.Index(fields=["puzzle"]),
+            models.Index(fields=["event_time"]),
+        ]
 
     event_type = models.CharField(
         max_length=20,
@@ -106,7 +137,42 @@ class UsageEvent(models.Model):
     event_body = models.JSONField(max_length=1000)
 
     session_id = models.CharField(max_length=36, blank=True, null=True)
-    event_time = models.DateTimeField(auto_now_add=True)
+    # set when the event is received rather than when its buffered batch is written
+    event_time = models.DateTimeField(default=timezone.now)
 
     def __str__(self):
         return f"{self.event_type}: {self.event_body}"
+
+
+class PuzzleStats(models.Model):
+    """
+    Per-puzzle counters rolled up from UsageEvent by the rollup_puzzle_stats command,
+    so stats can be read without scanning the events table.
+    """
+
+    puzzle = models.OneToOneField(
+        "Puzzle", on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    views = models.PositiveIntegerField(default=0)
+    solves = models.PositiveIntegerField(default=0)
+    fails = models.PositiveIntegerField(default=0)
+    guesses = models.PositiveIntegerField(default=0)
+    # number of guesses a solve took -> number of solves, keys are strings (JSON)
+    solve_guess_counts = models.JSONField(default=dict)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Stats for {self.puzzle_id}: {self.solves}/{self.views} solved"
+
+
+class RollupCursor(models.Model):
+    """
+    Id of the last UsageEvent a rollup has processed.
+    """
+
+    name = models.CharField(max_length=50, unique=True)
+    last_event_id = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.last_event_id}"
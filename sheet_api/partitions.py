@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import re
+from datetime import date, datetime, timezone
+
+from django.db import connection, transaction
+
+from sheet_api.models import UsageEvent
+
+USAGE_EVENT_TABLE = UsageEvent._meta.db_table
+DEFAULT_PARTITION = f"{USAGE_EVENT_TABLE}_default"
+PARTITION_NAME_RE = re.compile(rf"^{USAGE_EVENT_TABLE}_p(\d{{4}})_(\d{{2}})$")
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_bounds(month: date) -> tuple[datetime, datetime]:
+    """
+    Start and end (exclusive) of a monthly partition. Months are in UTC.
+    """
+    end = add_months(month, 1)
+    return (
+        datetime(month.year, month.month, 1, tzinfo=timezone.utc),
+        datetime(end.year, end.month, 1, tzinfo=timezone.utc),
+    )
+
+
+def partition_name(month: date) -> str:
+    return f"{USAGE_EVENT_TABLE}_p{month.year:04d}_{month.month:02d}"
+
+
+def expired_months(months: list[date], today: date, keep_months: int) -> list[date]:
+    """
+    Months older than the current month and the keep_months whole months before it.
+    """
+    cutoff = add_months(today.replace(day=1), -keep_months)
+    return [month for month in months if month < cutoff]
+
+
+def is_partitioned() -> bool:
+    """
+    Whether the usage event table is partitioned, which it only is on PostgreSQL.
+    """
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)",
+            [USAGE_EVENT_TABLE],
+        )
+        row = cursor.fetchone()
+    return row is not None and row[0] == "p"
+
+
+def list_partitions() -> list[date]:
+    """
+    Months that have their own partition, oldest first.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(%s)",
+            [USAGE_EVENT_TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    months = []
+    for name in names:
+        match = PARTITION_NAME_RE.match(name)
+        if match:
+            months.append(date(int(match[1]), int(match[2]), 1))
+    return sorted(months)
+
+
+def create_partition(month: date):
+    """
+    Add a partition for month. Rows for it that already landed in the default
+    partition are moved in, since attaching fails while the default holds any.
+    """
+    name = connection.ops.quote_name(partition_name(month))
+    table = connection.ops.quote_name(USAGE_EVENT_TABLE)
+    default = connection.ops.quote_name(DEFAULT_PARTITION)
+    start, end = month_bounds(month)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        )
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {default} "
+            f"WHERE event_time >= %s AND event_time < %s RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved",
+            [start, end],
+        )
+        cursor.execute(
+            f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)",
+            [start, end],
+        )
+
+
+def ensure_partitions(today: date, months_ahead: int) -> list[date]:
+    """
+    Create any missing partitions from today's month to months_ahead months later.
+    Returns the months created.
+    """
+    existing = set(list_partitions())
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(today.replace(day=1), offset)
+        if month not in existing:
+            create_partition(month)
+            created.append(month)
+    return created
+
+
+def drop_partition(month: date):
+    name = connection.ops.quote_name(partition_name(month))
+    table = connection.ops.quote_name(USAGE_EVENT_TABLE)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+        cursor.execute(f"DROP TABLE {name}")
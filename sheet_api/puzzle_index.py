@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date
+from typing import Iterable
+
+from django.db.models import Count, Max
+
+from sheet_api.caching import VersionedSnapshot
+from sheet_api.models import Puzzle
+
+
+@dataclass(frozen=True)
+class PuzzleAnswer:
+    answer_id: int
+    date: date
+
+
+def puzzle_table_version() -> tuple:
+    puzzles = Puzzle.objects.aggregate(count=Count("id"), last=Max("updated_at"))
+    return (puzzles["count"], puzzles["last"])
+
+
+def build_answer_map() -> dict[int, PuzzleAnswer]:
+    return {
+        puzzle_id: PuzzleAnswer(answer_id, puzzle_date)
+        for puzzle_id, answer_id, puzzle_date in Puzzle.objects.values_list(
+            "id", "answer_id", "date"
+        ).iterator(chunk_size=2000)
+    }
+
+
+# every puzzle id, so validating ids (e.g. on usage events) doesn't need a query
+answer_snapshot = VersionedSnapshot("answers", build_answer_map, puzzle_table_version)
+
+
+def get_puzzle_answer(puzzle_id: int) -> PuzzleAnswer | None:
+    answer = answer_snapshot.get().get(puzzle_id, None)
+    if answer is not None:
+        return answer
+
+    # puzzles created by another worker only show up at the next version check, so
+    # unknown ids are confirmed against the database
+    row = Puzzle.objects.filter(pk=puzzle_id).values_list("answer_id", "date").first()
+    if row is None:
+        return None
+    answer_snapshot.invalidate()
+    return PuzzleAnswer(*row)
+
+
+def puzzle_exists(puzzle_id: int) -> bool:
+    return get_puzzle_answer(puzzle_id) is not None
+
+
+def existing_puzzle_ids(puzzle_ids: Iterable[int]) -> set[int]:
+    answers = answer_snapshot.get()
+    puzzle_ids = set(puzzle_ids)
+    existing = {puzzle_id for puzzle_id in puzzle_ids if puzzle_id in answers}
+
+    unknown = puzzle_ids - existing
+    if unknown:
+        found = set(Puzzle.objects.filter(id__in=unknown).values_list("id", flat=True))
+        if found:
+            answer_snapshot.invalidate()
+        existing |= found
+    return existing
+
+
+def invalidate_answers():
+    answer_snapshot.invalidate()
@@ -0,0 +1,33 @@
+from sheet_api.caching import LRUCache
+from sheet_musicle_server.settings import (
+    COMPOSER_WORKS_CACHE_SIZE,
+    LATEST_PUZZLE_CACHE_LOCAL_SECONDS,
+    LATEST_PUZZLE_CACHE_SIZE,
+    SHARED_CACHE_ALIAS,
+)
+
+# serialized latest puzzle keyed by (puzzle type, user's local date)
+latest_puzzle_cache = LRUCache(
+    "latest_puzzle",
+    max_entries=LATEST_PUZZLE_CACHE_SIZE,
+    shared_alias=SHARED_CACHE_ALIAS,
+    local_ttl=LATEST_PUZZLE_CACHE_LOCAL_SECONDS,
+)
+
+# rendered JSON bytes of a composer's works list and the ETag of the version they
+# were rendered from, keyed by composer id
+composer_works_cache = LRUCache(
+    "composer_works",
+    max_entries=COMPOSER_WORKS_CACHE_SIZE,
+    shared_alias=SHARED_CACHE_ALIAS,
+)
+
+
+def invalidate_composer_works(composer_id: int):
+    composer_works_cache.delete(composer_id)
+    # the unfiltered list contains every composer's works
+    composer_works_cache.delete(None)
+
+
+def invalidate_response_caches():
+    latest_puzzle_cache.clear()
@@ -1,3 +1,5 @@
+from __future__ import annotations
+
 import os
 
 import boto3
@@ -19,3 +21,28 @@ def upload_sheet_music_file(filename, contents) -> str:
 
     cloudfront_path = CLOUDFRONT_DISTRO + "/" + new_filename
     return cloudfront_path
+
+
+def upload_json_file(key: str, body: bytes, s3=None):
+    s3 = s3 or boto3.client("s3")
+    s3.put_object(
+        Bucket=BUCKET_NAME,
+        Key=key,
+        Body=body,
+        ContentType="application/json",
+        # snapshot files are overwritten in place when they change
+        CacheControl="public, max-age=0, s-maxage=300",
+    )
+
+
+def download_file(key: str, s3=None) -> bytes | None:
+    s3 = s3 or boto3.client("s3")
+    try:
+        return s3.get_object(Bucket=BUCKET_NAME, Key=key)["Body"].read()
+    except s3.exceptions.NoSuchKey:
+        return None
+
+
+def delete_file(key: str, s3=None):
+    s3 = s3 or boto3.client("s3")
+    s3.delete_object(Bucket=BUCKET_NAME, Key=key)
@@ -4,7 +4,6 @@ import re
 from bs4 import BeautifulSoup, NavigableString
 
 from sheet_api.scraper.overrides import SiteOverride
-from sheet_api.scraper.page_helpers import get_page_text
 from sheet_api.scraper.scraped_work import ScrapedWork
 
 # class ScrapedWork:
@@ -19,13 +18,10 @@ from sheet_api.scraper.scraped_work import ScrapedWork
 
 
 class HandelScraper(SiteOverride):
-    def scrape_page(self) -> list[ScrapedWork]:
-        url = "https://en.wikipedia.org/wiki/List_of_compositions_by_George_Frideric_Handel"
-        text = get_page_text(url)
+    def page_url(self) -> str:
+        return "https://en.wikipedia.org/wiki/List_of_compositions_by_George_Frideric_Handel"
 
-        return self._parse_page(text)
-
-    def _parse_page(self, text: str) -> list[ScrapedWork]:
+    def parse_page(self, text: str) -> list[ScrapedWork]:
         soup = BeautifulSoup(text, "html.parser")
         works = []
         # find the first tbody in the document
@@ -1,3 +1,4 @@
+from sheet_api.scraper.page_helpers import get_page_text
 from sheet_api.scraper.scraped_work import ScrapedWork
 
 
@@ -6,9 +7,19 @@ class InvalidWork(Exception):
 
 
 class SiteOverride:
-    def scrape_page(self) -> list[ScrapedWork]:
+    """
+    For composers whose works come from a page other than IMSLP's list of works.
+    """
+
+    def page_url(self) -> str:
+        raise NotImplementedError
+
+    def parse_page(self, text: str) -> list[ScrapedWork]:
         raise NotImplementedError
 
+    def scrape_page(self) -> list[ScrapedWork]:
+        return self.parse_page(get_page_text(self.page_url()))
+
 
 class OpusOverride:
     pass
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+
+
+class PageNotCached(Exception):
+    pass
+
+
+@dataclass
+class CachedPage:
+    url: str
+    body_hash: str
+    encoding: str | None
+    etag: str | None
+    last_modified: str | None
+    fetched_at: float
+
+    def conditional_headers(self) -> dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class PageCache:
+    """
+    Scraped pages on disk. Bodies are stored gzipped under the sha256 of their
+    content, so a page that comes back unchanged (or the same page under two urls)
+    is only stored once. Each url has a small JSON entry with its body hash and the
+    validators to revalidate it with.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self.bodies_dir = os.path.join(cache_dir, "bodies")
+        self.urls_dir = os.path.join(cache_dir, "urls")
+
+    def _entry_path(self, url: str) -> str:
+        return os.path.join(
+            self.urls_dir, hashlib.sha1(url.encode()).hexdigest() + ".json"
+        )
+
+    def _body_path(self, body_hash: str) -> str:
+        return os.path.join(self.bodies_dir, body_hash[:2], body_hash + ".gz")
+
+    def lookup(self, url: str) -> CachedPage | None:
+        try:
+            with open(self._entry_path(url), "r") as f:
+                page = CachedPage(**json.load(f))
+        except (FileNotFoundError, json.JSONDecodeError, TypeError):
+            return None
+        if not os.path.exists(self._body_path(page.body_hash)):
+            return None
+        return page
+
+    def read_text(self, page: CachedPage) -> str:
+        with gzip.open(self._body_path(page.body_hash), "rb") as f:
+            return f.read().decode(page.encoding or "utf-8", errors="replace")
+
+    def store(
+        self,
+        url: str,
+        body: bytes,
+        encoding: str | None,
+        etag: str | None,
+        last_modified: str | None,
+    ) -> CachedPage:
+        body_hash = hashlib.sha256(body).hexdigest()
+        body_path = self._body_path(body_hash)
+        if not os.path.exists(body_path):
+            _write_atomic(body_path, gzip.compress(body))
+
+        page = CachedPage(
+            url=url,
+            body_hash=body_hash,
+            encoding=encoding,
+            etag=etag,
+            last_modified=last_modified,
+            fetched_at=time.time(),
+        )
+        self._save_entry(page)
+        return page
+
+    def touch(self, page: CachedPage):
+        """
+        Record that page was revalidated just now.
+        """
+        page.fetched_at = time.time()
+        self._save_entry(page)
+
+    def _save_entry(self, page: CachedPage):
+        _write_atomic(self._entry_path(page.url), json.dumps(asdict(page)).encode())
+
+
+def _write_atomic(path: str, data: bytes):
+    # scraper threads may write the same file, readers must never see half of one
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
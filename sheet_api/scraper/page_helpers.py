@@ -1,14 +1,235 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from sheet_api.metrics import register_collector
+from sheet_api.scraper.page_cache import PageCache, PageNotCached
+from sheet_musicle_server.settings import (
+    SCRAPER_CACHE_DIR,
+    SCRAPER_CONNECT_TIMEOUT,
+    SCRAPER_MAX_REQUESTS_PER_HOST,
+    SCRAPER_MAX_RETRIES,
+    SCRAPER_MIN_REQUEST_INTERVAL,
+    SCRAPER_OFFLINE,
+    SCRAPER_READ_TIMEOUT,
+)
+
+
+class HostRateLimiter:
+    """
+    Keeps concurrent scraping polite: per host, at most max_concurrent requests are in
+    flight and request starts are at least min_interval seconds apart.
+    """
+
+    def __init__(self, min_interval: float, max_concurrent: int):
+        self.min_interval = min_interval
+        self.max_concurrent = max_concurrent
+        self._lock = threading.Lock()
+        self._next_start: dict[str, float] = {}
+        self._slots: dict[str, threading.BoundedSemaphore] = {}
+
+    @contextmanager
+    def limit(self, url: str):
+        host = urlsplit(url).netloc
+        with self._lock:
+            slots = self._slots.setdefault(
+                host, threading.BoundedSemaphore(self.max_concurrent)
+            )
+
+        with slots:
+            # reserve the next start time under the lock, then wait outside of it
+            with self._lock:
+                now = time.monotonic()
+                start = max(now, self._next_start.get(host, 0.0))
+                self._next_start[host] = start + self.min_interval
+            if start > now:
+                time.sleep(start - now)
+            yield
+
+
+host_rate_limiter = HostRateLimiter(
+    SCRAPER_MIN_REQUEST_INTERVAL, SCRAPER_MAX_REQUESTS_PER_HOST
+)
+
+
+class FetchStats:
+    """
+    Counters for every page the scraper fetched, plus timings of the most recent ones.
+    """
+
+    def __init__(self, recent: int = 100):
+        self._lock = threading.Lock()
+        self.recent: deque[tuple[str, float, int]] = deque(maxlen=recent)
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            # answered from the page cache, after a 304 or without any request
+            self.revalidated = 0
+            self.replayed = 0
+            self.failed = 0
+            self.retries = 0
+            self.seconds = 0.0
+            # as transferred (possibly compressed) and after decoding
+            self.wire_bytes = 0
+            self.body_bytes = 0
+            self.recent.clear()
+
+    def record(
+        self,
+        url: str,
+        seconds: float,
+        wire_bytes: int,
+        body_bytes: int,
+        retries: int,
+        ok: bool,
+    ):
+        with self._lock:
+            self.requests += 1
+            self.failed += 0 if ok else 1
+            self.retries += retries
+            self.seconds += seconds
+            self.wire_bytes += wire_bytes
+            self.body_bytes += body_bytes
+            self.recent.append((url, seconds, body_bytes))
+
+    def record_cache_hit(self, revalidated: bool):
+        with self._lock:
+            if revalidated:
+                self.revalidated += 1
+            else:
+                self.replayed += 1
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "revalidated": self.revalidated,
+            "replayed": self.replayed,
+            "failed": self.failed,
+            "retries": self.retries,
+            "seconds": round(self.seconds, 3),
+            "wire_bytes": self.wire_bytes,
+            "body_bytes": self.body_bytes,
+        }
+
+    def summary(self) -> str:
+        average = self.seconds / self.requests if self.requests else 0
+        return (
+            f"{self.requests} pages ({self.failed} failed, {self.retries} retries, "
+            f"{self.revalidated} unchanged, {self.replayed} replayed from cache), "
+            f"{self.wire_bytes / 1024:.0f} KiB transferred "
+            f"({self.body_bytes / 1024:.0f} KiB decoded), {average:.2f}s per page"
+        )
+
+
+fetch_stats = FetchStats()
+register_collector("scraper", fetch_stats.stats)
+
+
+def make_session() -> requests.Session:
+    """
+    Session whose connections are kept alive and reused, retrying failed connections
+    and 429/5xx responses with exponential backoff (at once, then 1s, 2s, 4s, ...) or
+    as long as a Retry-After header asks. requests already asks for gzip and decodes it.
+    """
+    retry = Retry(
+        total=SCRAPER_MAX_RETRIES,
+        # urllib3 waits backoff_factor * 2 ** (retry - 1) seconds, skipping the first
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET", "HEAD"],
+        respect_retry_after_header=True,
+        # hand the last response back instead of raising, get_page_text reports it
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        max_retries=retry,
+        pool_connections=8,
+        pool_maxsize=SCRAPER_MAX_REQUESTS_PER_HOST,
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# connection pools are thread safe, so every scraper thread shares the session
+session = make_session()
+
+
+page_cache = PageCache(SCRAPER_CACHE_DIR) if SCRAPER_CACHE_DIR else None
+offline = SCRAPER_OFFLINE
+
+
+def configure_page_cache(cache_dir: str | None, replay_only: bool = False):
+    """
+    Cache pages in cache_dir (None disables the cache). With replay_only, pages are
+    only ever read from the cache, e.g. to iterate on overrides without the network.
+    """
+    global page_cache, offline
+    if replay_only and not cache_dir:
+        raise ValueError("Offline mode needs a cache directory")
+    page_cache = PageCache(cache_dir) if cache_dir else None
+    offline = replay_only
 
 
 def get_page_text(url: str) -> str:
-    try_page = requests.get(url)
-    print("Got response.")
-    status = try_page.status_code
-    if status == 404:
-        raise Exception("Page not found: " + url)
+    cached = page_cache.lookup(url) if page_cache else None
+    if offline:
+        if cached is None:
+            raise PageNotCached(f"Not in the page cache: {url}")
+        fetch_stats.record_cache_hit(revalidated=False)
+        return page_cache.read_text(cached)
+
+    start = time.perf_counter()
+    ok = False
+    wire_bytes = body_bytes = retries = 0
+    try:
+        with host_rate_limiter.limit(url):
+            try_page = session.get(
+                url,
+                headers=cached.conditional_headers() if cached else None,
+                timeout=(SCRAPER_CONNECT_TIMEOUT, SCRAPER_READ_TIMEOUT),
+            )
+            body_bytes = len(try_page.content)
+        # the raw response counts what came over the wire, before decompression
+        wire_bytes = try_page.raw.tell() or body_bytes
+        if try_page.raw.retries is not None:
+            retries = len(try_page.raw.retries.history)
+
+        print("Got response.")
+        status = try_page.status_code
+        if status == 304 and cached is not None:
+            ok = True
+            page_cache.touch(cached)
+            fetch_stats.record_cache_hit(revalidated=True)
+            return page_cache.read_text(cached)
+
+        if status == 404:
+            raise Exception("Page not found: " + url)
 
-    if status != 200:
-        raise Exception(f"Status ({status}) loading page: {url}")
+        if status != 200:
+            raise Exception(f"Status ({status}) loading page: {url}")
 
-    return try_page.text
+        ok = True
+        if page_cache is not None:
+            page_cache.store(
+                url,
+                try_page.content,
+                # what .text decoded with, guessed if the headers didn't say
+                try_page.encoding or try_page.apparent_encoding,
+                try_page.headers.get("ETag", None),
+                try_page.headers.get("Last-Modified", None),
+            )
+        return try_page.text
+    finally:
+        fetch_stats.record(
+            url, time.perf_counter() - start, wire_bytes, body_bytes, retries, ok
+        )
@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import hashlib
+import importlib
+import inspect
 import json
 import os
 import re
@@ -8,11 +11,20 @@ import requests
 from bs4 import BeautifulSoup
 
 import argparse
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from functools import lru_cache, partial
 
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 
+from sheet_api.composer_helpers import (
+    defer_composer_work_stats,
+    refresh_composer_work_stats,
+)
 from sheet_api.models import Composer, Work
+from sheet_api.response_cache import invalidate_response_caches
 from sheet_api.scraper.custom_scrapers import HandelScraper
 from sheet_api.scraper.overrides import (
     SiteOverride,
@@ -41,10 +53,20 @@ from sheet_api.scraper.overrides import (
     SchubertOpusCol,
     SchubertWorks,
 )
-from sheet_api.scraper.page_helpers import get_page_text
+from sheet_api.scraper.page_helpers import fetch_stats, get_page_text
 from sheet_api.scraper.scraped_work import ScrapedWork
 
 COMPOSERS_FILE = "all_composers.json"
+MAX_WORK_TITLE_LENGTH = 200
+BULK_BATCH_SIZE = 1000
+HTML_COMMENT_RE = re.compile(r"<!--.*?-->", re.DOTALL)
+PARSER_MODULES = (
+    "sheet_api.scraper.scraper",
+    "sheet_api.scraper.overrides",
+    "sheet_api.scraper.custom_scrapers",
+    "sheet_api.scraper.scraped_work",
+)
+IMSLP_WORKS_URL = "https://imslp.org/wiki/List_of_works_by_{}"
 
 
 class InvalidComposer(Exception):
@@ -69,6 +91,58 @@ def is_date_col(composer: str, header_col: str) -> bool:
         return header_col == "Date"
 
 
+def truncate_work_title(work_title: str) -> str:
+    if len(work_title) > MAX_WORK_TITLE_LENGTH:
+        return work_title[: MAX_WORK_TITLE_LENGTH - 3] + "..."
+    return work_title
+
+
+def composer_display_name(composer: str) -> str:
+    try:
+        # name override, in case imslp's name differs from what we want to display
+        name_func_cl = config_by_composer[composer].name_override
+        return name_func_cl.get_name()
+    except (KeyError, NotImplementedError):
+        return composer
+
+
+def page_hash(text: str) -> str:
+    # mediawiki pages carry render timestamps and stats in comments, which change
+    # without the page changing
+    return hashlib.sha256(HTML_COMMENT_RE.sub("", text).encode()).hexdigest()
+
+
+def _source(obj) -> str:
+    try:
+        return inspect.getsource(obj)
+    except (OSError, TypeError):
+        return getattr(obj, "__qualname__", repr(obj))
+
+
+@lru_cache(maxsize=None)
+def parser_config_version() -> str:
+    """
+    Hash of the code that decides what a page is saved as: PARSER_MODULES in full,
+    i.e. the IMSLP parser, every override and custom scraper, and the save path.
+    When any of it changes, unchanged pages are parsed again. Anything else (e.g.
+    the database or a library) changing the outcome needs scrape_composers --force.
+    """
+    digest = hashlib.sha256()
+    for module_name in PARSER_MODULES:
+        digest.update(_source(importlib.import_module(module_name)).encode())
+    return digest.hexdigest()
+
+
+@dataclass
+class ComposerScrape:
+    composer: str
+    works: list[ScrapedWork] | None
+    source_hash: str
+    config_version: str
+    # page and config match what the last scan saved, so nothing was parsed
+    unchanged: bool = False
+
+
 class ComposerOptions:
     def __init__(
         self,
@@ -127,8 +201,17 @@ config_by_composer: dict[str, ComposerOptions] = {
 class Parser:
     DRY_RUN_PREFIX = "[DRY_RUN]"
 
-    def __init__(self, writes_to_db: bool = False):
+    def __init__(
+        self,
+        writes_to_db: bool = False,
+        works_url: str = IMSLP_WORKS_URL,
+        bulk_writes: bool = True,
+    ):
         self.writes_to_db = writes_to_db
+        self.works_url = works_url
+        # diff and write each composer's works in a few bulk queries, rather than a
+        # get_or_create/update_or_create per work
+        self.bulk_writes = bulk_writes
         self.composer_list = []
         self._init_composer_list()
 
@@ -296,12 +379,7 @@ class Parser:
                 key_text = tds[key_col].text.strip()
                 work_title += " in " + key_text
 
-            try:
-                # name override, in case imslp's name differs from what we want to display
-                name_func_cl = config_by_composer[composer].name_override
-                display_name = name_func_cl.get_name()
-            except (KeyError, NotImplementedError):
-                display_name = composer
+            display_name = composer_display_name(composer)
             # naive first/last split
             firstname = display_name.split(" ")[0]
             lastname = display_name.split(" ")[-1]
@@ -326,7 +404,7 @@ class Parser:
         return all_works
 
     def _parse_composer_imslp(self, composer: str) -> list[ScrapedWork]:
-        url = f"https://imslp.org/wiki/List_of_works_by_{composer.replace(' ', '_')}"
+        url = self.works_url.format(composer.replace(" ", "_"))
         text = get_page_text(url)
         print(f"Scraping IMSLP: {url}")
         return self.scrape_imslp_page(composer, text)
@@ -337,41 +415,284 @@ class Parser:
         else:
             print("Dry run, not writing to database")
 
-    def scrape_composer(self, composer: str):
+    def fetch_composer_works(
+        self, composer: str, last_scan: tuple[str, str] | None = None
+    ) -> ComposerScrape:
+        """
+        Fetch and parse composer's page. If last_scan, the (source hash, config
+        version) stored by the previous scan, still matches, the page isn't parsed.
+        """
+        try:
+            page_cl = config_by_composer[composer].page_override
+            url = page_cl.page_url()
+            parse = page_cl.parse_page
+        except (KeyError, NotImplementedError):
+            url = self.works_url.format(composer.replace(" ", "_"))
+            parse = partial(self.scrape_imslp_page, composer)
+
+        print(f"Scraping: {url}")
+        text = get_page_text(url)
+        source_hash = page_hash(text)
+        config_version = parser_config_version()
+        if last_scan == (source_hash, config_version):
+            return ComposerScrape(composer, None, source_hash, config_version, True)
+
+        return ComposerScrape(composer, parse(text), source_hash, config_version)
+
+    def scrape_composer(self, composer: str, force: bool = True):
         self.print_write_status()
 
         if composer not in self.composer_list:
             raise InvalidComposer(f"Composer not found: {composer}")
 
-        try:
-            page_cl = config_by_composer[composer].page_override
-            works = page_cl.scrape_page()
-        except (KeyError, NotImplementedError):
-            works = self._parse_composer_imslp(composer)
-
-        self.save_composer_works(works)
+        last_scan = None if force else self._last_scans().get(composer, None)
+        self._save_scrape(self.fetch_composer_works(composer, last_scan))
 
     def _parse_composer_impl(self, composer: str) -> list[ScrapedWork] | None:
         return self._parse_composer_imslp(composer)
 
-    def scrape_all_composers(self):
+    def scrape_all_composers(
+        self,
+        workers: int = 1,
+        composers: list[str] | None = None,
+        force: bool = False,
+    ) -> list[str]:
+        """
+        Scrape every composer (or just composers), fetching and parsing up to workers
+        pages at once. Works are saved one composer at a time on the calling thread,
+        so database writes never interleave. Composers whose page and overrides are
+        unchanged since their last scan are skipped, unless force.
+        Returns the composers that failed.
+        """
         self.print_write_status()
+        if composers is None:
+            composers = self.composer_list
+        last_scans = {} if force else self._last_scans()
+
+        failed = []
+        unchanged = 0
+        with ThreadPoolExecutor(
+            max_workers=max(1, workers), thread_name_prefix="scraper"
+        ) as pool:
+            futures = {
+                pool.submit(
+                    self.fetch_composer_works, composer, last_scans.get(composer, None)
+                ): composer
+                for composer in composers
+            }
+            for future in as_completed(futures):
+                composer = futures[future]
+                try:
+                    scrape = future.result()
+                except Exception as e:
+                    # one broken page shouldn't stop a full rescan
+                    print(f"Could not scrape {composer}: {e}")
+                    failed.append(composer)
+                    continue
 
-        for composer in self.composer_list:
-            print("Scraping composer: " + composer)
-            try:
-                page_cl = config_by_composer[composer].page_override
-                works = page_cl.scrape_page()
-            except (KeyError, NotImplementedError):
-                works = self._parse_composer_imslp(composer)
-
-            if works is None:
-                continue
+                if scrape.unchanged:
+                    print("Unchanged since the last scan: " + composer)
+                    unchanged += 1
+                    continue
 
-            self.save_composer_works(works)
+                print("Scraped composer: " + composer)
+                self._save_scrape(scrape)
+
+        print(f"Skipped {unchanged} unchanged composers")
+        print("Fetched " + fetch_stats.summary())
+        return failed
+
+    def _last_scans(self) -> dict[str, tuple[str, str]]:
+        """
+        (source hash, config version) of every composer's last scan, keyed by the
+        name in the composer list.
+        """
+        by_display_name = {
+            full_name: (source_hash, config_version)
+            for full_name, source_hash, config_version in Composer.objects.values_list(
+                "full_name", "source_hash", "config_version"
+            )
+        }
+        return {
+            composer: by_display_name[composer_display_name(composer)]
+            for composer in self.composer_list
+            if composer_display_name(composer) in by_display_name
+        }
+
+    def _save_scrape(self, scrape: ComposerScrape):
+        if scrape.unchanged or scrape.works is None:
+            return
+
+        self.save_composer_works(scrape.works)
+        if self.writes_to_db:
+            # only recorded once the works are saved, so a failed save is retried.
+            # by display name too, so a page that parses to no works is remembered
+            # (unless the composer was never saved, then there's nothing to skip)
+            names = {work.composer_fullname for work in scrape.works}
+            names.add(composer_display_name(scrape.composer))
+            Composer.objects.filter(full_name__in=names).update(
+                source_hash=scrape.source_hash, config_version=scrape.config_version
+            )
 
-    def save_composer_works(self, works: list[ScrapedWork]):
+    def save_composer_works(self, works: list[ScrapedWork]) -> Counter:
+        """
+        Save scraped works. Returns counts of added/updated/unchanged/skipped works
+        (only filled in by bulk writes).
+        """
         print("Total works: " + str(len(works)))
+        counts = Counter()
+        if self.writes_to_db and self.bulk_writes:
+            composer_ids, counts = self._bulk_save_works(works)
+        else:
+            # refresh each composer's stored work stats once, rather than once per work
+            with defer_composer_work_stats():
+                composer_ids = self._save_works(works)
+
+        for composer_id in composer_ids:
+            refresh_composer_work_stats(composer_id)
+        if self.writes_to_db and self.bulk_writes:
+            # bulk writes send no signals. the catalog, work index and works lists
+            # notice through updated_at/last_scanned in every process; cached latest
+            # puzzles embed their answer, so bump their (shared) generation
+            invalidate_response_caches()
+            print(
+                f"Added {counts['added']}, updated {counts['updated']}, "
+                f"unchanged {counts['unchanged']}, skipped {counts['skipped']} works"
+            )
+        return counts
+
+    def _bulk_save_works(self, works: list[ScrapedWork]) -> tuple[set[int], Counter]:
+        works_by_composer = defaultdict(list)
+        for work in works:
+            name = (
+                work.composer_fullname,
+                work.composer_firstname,
+                work.composer_lastname,
+            )
+            works_by_composer[name].append(work)
+
+        composer_ids = set()
+        counts = Counter()
+        for (
+            full_name,
+            first_name,
+            last_name,
+        ), composer_works in works_by_composer.items():
+            with transaction.atomic():
+                composer, created = Composer.objects.get_or_create(
+                    full_name=full_name, first_name=first_name, last_name=last_name
+                )
+                if created:
+                    print("Added composer: " + full_name)
+                counts += self._bulk_save_composer_works(composer, composer_works)
+            composer_ids.add(composer.id)
+
+        return composer_ids, counts
+
+    def _bulk_save_composer_works(
+        self, composer: Composer, works: list[ScrapedWork]
+    ) -> Counter:
+        now = timezone.now()
+        # keyed like the unique constraint on Work, the first of any duplicates wins
+        scraped = {}
+        for work in works:
+            key = (truncate_work_title(work.work_title), work.opus, work.opus_number)
+            scraped.setdefault(key, work)
+
+        existing = {
+            (row.work_title, row.opus, row.opus_number): row
+            for row in Work.objects.filter(
+                work_title__in={key[0] for key in scraped}
+            ).only(
+                "id",
+                "work_title",
+                "opus",
+                "opus_number",
+                "composition_year",
+                "composer_id",
+            )
+        }
+
+        counts = Counter()
+        to_create = []
+        to_update = []
+        unchanged_ids = []
+        for key, work in scraped.items():
+            row = existing.get(key, None)
+            if row is None:
+                to_create.append(
+                    Work(
+                        work_title=key[0],
+                        composition_year=work.composition_year,
+                        opus=work.opus,
+                        opus_number=work.opus_number,
+                        composer=composer,
+                        last_scanned=now,
+                    )
+                )
+            elif row.composer_id != composer.id:
+                print(f"Found duplicate work of another composer, skipping: {key[0]}")
+                counts["skipped"] += 1
+            elif row.composition_year != work.composition_year:
+                row.composition_year = work.composition_year
+                row.last_scanned = now
+                # bulk_update doesn't apply auto_now
+                row.updated_at = now
+                to_update.append(row)
+            else:
+                unchanged_ids.append(row.id)
+
+        # a conflict means a concurrent scan added the work since we looked
+        Work.objects.bulk_create(
+            to_create,
+            batch_size=BULK_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=["work_title", "opus", "opus_number"],
+            update_fields=["last_scanned"],
+        )
+        Work.objects.bulk_update(
+            to_update,
+            ["composition_year", "last_scanned", "updated_at"],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        # rescanned works keep their row, only the scan time moves
+        Work.objects.filter(id__in=unchanged_ids).update(last_scanned=now)
+
+        conflicts = self._count_insert_conflicts(to_create)
+        counts.update(
+            added=len(to_create) - conflicts,
+            updated=len(to_update),
+            unchanged=len(unchanged_ids),
+            skipped=conflicts,
+        )
+        return counts
+
+    def _count_insert_conflicts(self, created: list[Work]) -> int:
+        """
+        How many of the works passed to bulk_create were already added by someone
+        else, which the upsert can't report. Ours carry the first_scanned that
+        bulk_create set on them, rows added by a concurrent scan have their own.
+        """
+        if not created:
+            return 0
+
+        ours = {
+            (work.work_title, work.opus, work.opus_number): work.first_scanned
+            for work in created
+        }
+        stored = Work.objects.filter(work_title__in={key[0] for key in ours})
+        conflicts = 0
+        for title, opus, opus_number, first_scanned in stored.values_list(
+            "work_title", "opus", "opus_number", "first_scanned"
+        ):
+            key = (title, opus, opus_number)
+            if key in ours and ours[key] != first_scanned:
+                print(f"Work added by a concurrent scan, skipping: {title}")
+                conflicts += 1
+        return conflicts
+
+    def _save_works(self, works: list[ScrapedWork]) -> set[int]:
+        composer_ids = set()
         for work in works:
             if self.writes_to_db:
                 composer, created = Composer.objects.get_or_create(
@@ -381,12 +702,11 @@ class Parser:
                 )
                 if created:
                     print("Added composer: " + work.composer_fullname)
+                composer_ids.add(composer.id)
             else:
                 print(f"{Parser.DRY_RUN_PREFIX} Composer: {work.composer_fullname}")
 
-            work_title = work.work_title
-            if len(work.work_title) > 200:
-                work_title = work.work_title[:197] + "..."
+            work_title = truncate_work_title(work.work_title)
             if self.writes_to_db:
                 try:
                     _, created = Work.objects.update_or_create(
@@ -407,6 +727,8 @@ class Parser:
                 print(f"{Parser.DRY_RUN_PREFIX}\tOpus: {work.opus}")
                 print(f"{Parser.DRY_RUN_PREFIX}\tOpus number: {work.opus_number}")
 
+        return composer_ids
+
 
 if __name__ == "__main__":
     with open(COMPOSERS_FILE, "r") as f:
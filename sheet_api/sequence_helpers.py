@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+from datetime import date
+
+from sheet_api.models import Puzzle
+
+
+def renumber_puzzles(puzzle_type: str, from_date: date | None = None) -> int:
+    """
+    Recompute the stored sequence numbers for one puzzle type.
+
+    If from_date is given, only puzzles on or after that date are renumbered, since
+    inserting/moving/deleting a puzzle cannot change the position of anything before it.
+    Returns the number of puzzles whose sequence number changed.
+    """
+    puzzles = Puzzle.objects.filter(type=puzzle_type)
+    start = 0
+    if from_date is not None:
+        start = puzzles.filter(date__lt=from_date).count()
+        puzzles = puzzles.filter(date__gte=from_date)
+
+    changed = []
+    rows = puzzles.order_by("date").values_list("id", "sequence_number")
+    for expected, (puzzle_id, sequence_number) in enumerate(rows, start=start + 1):
+        if sequence_number != expected:
+            changed.append(Puzzle(id=puzzle_id, sequence_number=expected))
+
+    Puzzle.objects.bulk_update(changed, ["sequence_number"], batch_size=1000)
+    return len(changed)
@@ -2,9 +2,9 @@ from django.contrib.auth.models import User, Group
 from django.db.models import Max
 from rest_framework import serializers
 
-from sheet_api.models import Puzzle, Work, Composer, UsageEvent
-from sheet_api.time_helpers import get_timezone_aware_date
-from sheet_musicle_server.settings import HIDE_NEW_PUZZLES
+from sheet_api.frontier import get_latest_visible_date
+from sheet_api.models import Puzzle, PuzzleStats, Work, Composer, UsageEvent
+from sheet_api.time_helpers import get_request_date
 
 
 class UserSerializer(serializers.HyperlinkedModelSerializer):
@@ -19,8 +19,43 @@ class GroupSerializer(serializers.HyperlinkedModelSerializer):
         fields = ["url", "name"]
 
 
+# the answer nested in a puzzle keeps its original fields, bookkeeping columns added
+# to the models since (hashes, counters, updated_at) are not part of the puzzle payload
+class PuzzleComposerSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Composer
+        fields = [
+            "id",
+            "full_name",
+            "first_name",
+            "last_name",
+            "born_year",
+            "died_year",
+            "catalog_prefix",
+            "first_scanned",
+            "last_scanned",
+        ]
+
+
+class PuzzleAnswerSerializer(serializers.ModelSerializer):
+    composer = PuzzleComposerSerializer()
+
+    class Meta:
+        model = Work
+        fields = [
+            "id",
+            "work_title",
+            "composition_year",
+            "opus",
+            "opus_number",
+            "composer",
+            "first_scanned",
+            "last_scanned",
+        ]
+
+
 class PuzzleSerializer(serializers.ModelSerializer):
-    sequence_number = serializers.SerializerMethodField()
+    answer = PuzzleAnswerSerializer()
     is_latest = serializers.SerializerMethodField()
 
     class Meta:
@@ -35,28 +70,12 @@ class PuzzleSerializer(serializers.ModelSerializer):
             "sequence_number",
             "is_latest",
         ]
-        depth = 2
-
-    def get_sequence_number(self, obj: Puzzle):
-        return Puzzle.objects.filter(type=obj.type, date__lte=obj.date).count()
 
     def get_is_latest(self, obj: Puzzle):
-        # get all puzzles with dates greater than this puzzle
-        upcoming_puzzles = Puzzle.objects.filter(
-            type=obj.type, date__gt=obj.date
-        ).order_by("date")
-        if HIDE_NEW_PUZZLES:
-            tz_date = get_timezone_aware_date()
-
-            # if there are any puzzles which can still be shown (i.e. their date still before the current date),
-            # then this is not the fake latest puzzle
-            for puzzle in upcoming_puzzles:
-                if puzzle.date < tz_date:
-                    return False
-
-            return True
-
-        return len(upcoming_puzzles) == 0
+        # a puzzle is the latest if no newer puzzle of its type is visible yet
+        today = get_request_date(self.context.get("request", None))
+        frontier = get_latest_visible_date(obj.type, today)
+        return frontier is None or obj.date >= frontier
 
 
 class ComposerSerializer(serializers.ModelSerializer):
@@ -70,6 +89,9 @@ class ComposerSerializer(serializers.ModelSerializer):
             "catalog_prefix",
             "born_year",
             "died_year",
+            "min_composition_year",
+            "max_composition_year",
+            "work_count",
             "last_scanned",
         ]
 
@@ -109,3 +131,24 @@ class UsageEventSerializer(serializers.ModelSerializer):
     class Meta:
         model = UsageEvent
         fields = ["event_type", "puzzle", "event_body", "session_id", "event_time"]
+
+
+class GuessSerializer(serializers.Serializer):
+    work = serializers.IntegerField(required=True)
+    session_id = serializers.CharField(
+        max_length=36, required=False, allow_null=True, allow_blank=True
+    )
+
+
+class PuzzleStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PuzzleStats
+        fields = [
+            "puzzle",
+            "views",
+            "solves",
+            "fails",
+            "guesses",
+            "solve_guess_counts",
+            "updated_at",
+        ]
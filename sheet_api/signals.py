@@ -0,0 +1,127 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from sheet_api.catalog import invalidate_catalog
+from sheet_api.composer_helpers import (
+    composer_work_stats_deferred,
+    refresh_composer_work_stats,
+)
+from sheet_api.frontier import invalidate_frontier
+from sheet_api.puzzle_index import invalidate_answers
+from sheet_api.models import Composer, Puzzle, Work
+from sheet_api.response_cache import (
+    invalidate_composer_works,
+    invalidate_response_caches,
+)
+from sheet_api.sequence_helpers import renumber_puzzles
+from sheet_api.work_index import invalidate_work_index
+
+
+@receiver(pre_save, sender=Puzzle)
+def remember_puzzle_position(sender, instance: Puzzle, raw=False, **kwargs):
+    # stash the type/date the row had before this save, so post_save knows what moved
+    instance._previous_position = None
+    if raw or instance.pk is None:
+        return
+
+    instance._previous_position = (
+        Puzzle.objects.filter(pk=instance.pk).values_list("type", "date").first()
+    )
+
+
+@receiver(post_save, sender=Puzzle)
+def update_sequence_numbers_on_save(
+    sender, instance: Puzzle, created: bool, raw=False, **kwargs
+):
+    if raw:
+        return
+
+    previous = getattr(instance, "_previous_position", None)
+    if not created and previous == (instance.type, instance.date):
+        # nothing that affects ordering changed
+        return
+
+    if previous is None:
+        renumber_puzzles(instance.type, instance.date)
+    elif previous[0] != instance.type:
+        renumber_puzzles(previous[0], previous[1])
+        renumber_puzzles(instance.type, instance.date)
+    else:
+        renumber_puzzles(instance.type, min(previous[1], instance.date))
+
+    instance.sequence_number = (
+        Puzzle.objects.filter(pk=instance.pk)
+        .values_list("sequence_number", flat=True)
+        .first()
+    )
+
+
+@receiver(post_delete, sender=Puzzle)
+def update_sequence_numbers_on_delete(sender, instance: Puzzle, **kwargs):
+    renumber_puzzles(instance.type, instance.date)
+
+
+@receiver(post_save, sender=Puzzle)
+@receiver(post_delete, sender=Puzzle)
+def invalidate_puzzle_caches(sender, **kwargs):
+    invalidate_frontier()
+    invalidate_answers()
+
+
+@receiver(post_save, sender=Puzzle)
+@receiver(post_delete, sender=Puzzle)
+@receiver(post_save, sender=Work)
+@receiver(post_delete, sender=Work)
+@receiver(post_save, sender=Composer)
+@receiver(post_delete, sender=Composer)
+def invalidate_cached_responses(sender, **kwargs):
+    invalidate_response_caches()
+
+
+@receiver(post_save, sender=Work)
+@receiver(post_delete, sender=Work)
+@receiver(post_save, sender=Composer)
+@receiver(post_delete, sender=Composer)
+def invalidate_work_snapshots(sender, **kwargs):
+    invalidate_catalog()
+    invalidate_work_index()
+
+
+@receiver(post_save, sender=Work)
+@receiver(post_delete, sender=Work)
+def invalidate_cached_works_list(sender, instance: Work, **kwargs):
+    invalidate_composer_works(instance.composer_id)
+    previous = getattr(instance, "_previous_composer_id", None)
+    if previous is not None and previous != instance.composer_id:
+        invalidate_composer_works(previous)
+
+
+@receiver(pre_save, sender=Work)
+def remember_work_composer(sender, instance: Work, raw=False, **kwargs):
+    # a work moved to another composer changes both composers' stats
+    instance._previous_composer_id = None
+    if raw or instance.pk is None or composer_work_stats_deferred():
+        return
+
+    instance._previous_composer_id = (
+        Work.objects.filter(pk=instance.pk)
+        .values_list("composer_id", flat=True)
+        .first()
+    )
+
+
+@receiver(post_save, sender=Work)
+def update_composer_stats_on_save(sender, instance: Work, raw=False, **kwargs):
+    if raw or composer_work_stats_deferred():
+        return
+
+    refresh_composer_work_stats(instance.composer_id)
+    previous = getattr(instance, "_previous_composer_id", None)
+    if previous is not None and previous != instance.composer_id:
+        refresh_composer_work_stats(previous)
+
+
+@receiver(post_delete, sender=Work)
+def update_composer_stats_on_delete(sender, instance: Work, **kwargs):
+    if not composer_work_stats_deferred():
+        refresh_composer_work_stats(instance.composer_id)
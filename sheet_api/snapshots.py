@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import hashlib
+from datetime import date, timedelta
+
+from rest_framework.renderers import JSONRenderer
+
+from sheet_api.models import Puzzle
+from sheet_api.serializers import PuzzleSerializer
+from sheet_api.time_helpers import get_timezone_aware_date
+from sheet_musicle_server.settings import HIDE_NEW_PUZZLES
+
+MANIFEST_PATH = "manifest.json"
+# UTC+14, the first place on earth where a new day starts
+FURTHEST_AHEAD_TIMEZONE = "Pacific/Kiritimati"
+
+
+def content_hash(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+
+def render_snapshots() -> dict[str, bytes]:
+    """
+    Render every visible puzzle to static JSON, keyed by relative path:
+
+    puzzles/<category>/<sequence number>.json  same body as PuzzleBySequenceNumberView
+    puzzles/<category>/latest/<date>.json      which puzzle is the latest on that date
+
+    Clients look up the pointer for their own local date, so everything up to the
+    furthest-ahead local date is rendered, the same frontier the API has for
+    visitors in that timezone.
+    """
+    today = get_timezone_aware_date(FURTHEST_AHEAD_TIMEZONE)
+    renderer = JSONRenderer()
+    files = {}
+
+    for choice in Puzzle.PuzzleType:
+        category = choice.name.lower()
+        puzzles = (
+            Puzzle.objects.select_related("answer__composer")
+            .filter(type=choice)
+            .order_by("date")
+        )
+        if HIDE_NEW_PUZZLES:
+            puzzles = puzzles.filter(date__lte=today)
+
+        latest = None
+        for puzzle in puzzles:
+            path = f"puzzles/{category}/{puzzle.sequence_number}.json"
+            files[path] = renderer.render(PuzzleSerializer(puzzle).data)
+
+            # every day up to the next puzzle still points at this one
+            if latest is not None:
+                _add_latest_pointers(files, category, latest, puzzle.date)
+            latest = puzzle
+
+        if latest is not None:
+            _add_latest_pointers(
+                files, category, latest, max(today, latest.date) + timedelta(days=1)
+            )
+
+    return files
+
+
+def _add_latest_pointers(
+    files: dict[str, bytes], category: str, puzzle: Puzzle, until: date
+):
+    body = JSONRenderer().render(
+        {
+            "id": puzzle.id,
+            "date": puzzle.date,
+            "sequence_number": puzzle.sequence_number,
+            "path": f"puzzles/{category}/{puzzle.sequence_number}.json",
+        }
+    )
+    day = puzzle.date
+    while day < until:
+        files[f"puzzles/{category}/latest/{day.isoformat()}.json"] = body
+        day += timedelta(days=1)
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from sheet_api.models import PuzzleStats, RollupCursor, UsageEvent
+
+PUZZLE_STATS_CURSOR = "puzzle_stats"
+ROLLUP_BATCH_SIZE = 5000
+# buffered events from several workers don't commit in id order, so events newer than
+# this are left for the next run, by when any lower ids are committed too
+ROLLUP_LAG_SECONDS = 60
+
+EVENT_COUNTERS = {
+    UsageEvent.EventType.PUZZLE_VIEWED: "views",
+    UsageEvent.EventType.PUZZLE_SOLVED: "solves",
+    UsageEvent.EventType.PUZZLE_FAILED: "fails",
+    UsageEvent.EventType.GUESS_MADE: "guesses",
+}
+
+
+def solve_guess_count(event_body) -> int | None:
+    """
+    Number of guesses a solve took, if the client sent it as "guesses" (a count or
+    the list of guesses).
+    """
+    if not isinstance(event_body, dict):
+        return None
+    guesses = event_body.get("guesses", None)
+    if isinstance(guesses, list):
+        return len(guesses)
+    if isinstance(guesses, int) and not isinstance(guesses, bool) and guesses >= 0:
+        return guesses
+    return None
+
+
+def _apply_batch(events: list[dict]):
+    counters = defaultdict(Counter)
+    guess_counts = defaultdict(Counter)
+    for event in events:
+        field = EVENT_COUNTERS.get(event["event_type"], None)
+        if field is None:
+            continue
+        counters[event["puzzle_id"]][field] += 1
+
+        if event["event_type"] == UsageEvent.EventType.PUZZLE_SOLVED:
+            count = solve_guess_count(event["event_body"])
+            if count is not None:
+                guess_counts[event["puzzle_id"]][str(count)] += 1
+
+    existing = PuzzleStats.objects.select_for_update().in_bulk(list(counters))
+    created = []
+    now = timezone.now()
+    for puzzle_id, deltas in counters.items():
+        stats = existing.get(puzzle_id, None)
+        if stats is None:
+            stats = PuzzleStats(puzzle_id=puzzle_id)
+            created.append(stats)
+        # bulk_update doesn't apply auto_now
+        stats.updated_at = now
+
+        for field, delta in deltas.items():
+            setattr(stats, field, getattr(stats, field) + delta)
+        histogram = Counter(stats.solve_guess_counts)
+        histogram.update(guess_counts[puzzle_id])
+        stats.solve_guess_counts = dict(histogram)
+
+    PuzzleStats.objects.bulk_create(created)
+    PuzzleStats.objects.bulk_update(
+        existing.values(),
+        [*EVENT_COUNTERS.values(), "solve_guess_counts", "updated_at"],
+    )
+
+
+def rollup_puzzle_stats(
+    batch_size: int = ROLLUP_BATCH_SIZE, lag_seconds: float = ROLLUP_LAG_SECONDS
+) -> int:
+    """
+    Add every usage event since the last run to PuzzleStats. Each batch and the cursor
+    move in one transaction, so an interrupted run never counts an event twice.
+    Returns the number of events processed.
+
+    The cursor is an id, so an event is never counted if its row commits after a
+    higher id was rolled up: one that took longer than lag_seconds from being
+    received to being written (e.g. a flush retried through a database outage).
+    """
+    settled = UsageEvent.objects.filter(
+        event_time__lt=timezone.now() - timedelta(seconds=lag_seconds)
+    )
+    processed = 0
+    while True:
+        with transaction.atomic():
+            cursor, _ = RollupCursor.objects.select_for_update().get_or_create(
+                name=PUZZLE_STATS_CURSOR
+            )
+            # the newest settled id is only looked up on the first batch
+            if processed == 0:
+                upper = settled.filter(id__gt=cursor.last_event_id).aggregate(
+                    upper=Max("id")
+                )["upper"]
+                if upper is None:
+                    return 0
+
+            events = list(
+                UsageEvent.objects.filter(id__gt=cursor.last_event_id, id__lte=upper)
+                .order_by("id")
+                .values("id", "puzzle_id", "event_type", "event_body")[:batch_size]
+            )
+            if not events:
+                return processed
+
+            _apply_batch(events)
+            cursor.last_event_id = events[-1]["id"]
+            cursor.save(update_fields=["last_event_id"])
+            processed += len(events)
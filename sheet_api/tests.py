@@ -1,3 +1,1157 @@
-from django.test import TestCase
+import contextlib
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipIf, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+
+from sheet_api.caching import LRUCache, VersionedSnapshot
+from sheet_api.catalog import catalog_snapshot, get_catalog
+from sheet_api.management.commands.bench_scraper import synthetic_works_page
+from sheet_api.management.commands.export_puzzle_snapshots import LocalSnapshotStore
+from sheet_api.frontier import get_latest_visible_date, invalidate_frontier
+from sheet_api.puzzle_index import answer_snapshot
+from sheet_api.scraper.scraped_work import ScrapedWork
+from sheet_api.scraper import page_helpers, scraper
+from sheet_api.scraper.page_cache import PageNotCached
+from sheet_api.scraper.scraper import Parser
+from sheet_api.models import (
+    Composer,
+    Puzzle,
+    PuzzleStats,
+    RollupCursor,
+    UsageEvent,
+    Work,
+)
+from sheet_api.partitions import (
+    PARTITION_NAME_RE,
+    add_months,
+    create_partition,
+    expired_months,
+    is_partitioned,
+    list_partitions,
+    month_bounds,
+    partition_name,
+)
+from sheet_api.response_cache import latest_puzzle_cache
+from sheet_api.sequence_helpers import renumber_puzzles
+from sheet_api.stats_rollup import PUZZLE_STATS_CURSOR, rollup_puzzle_stats
+from sheet_api.usage_events import UsageEventBuffer, make_usage_event
+from sheet_api.work_index import fold, get_work_index, work_index_snapshot
+
+
+class PuzzleSequenceNumberTest(TestCase):
+    def setUp(self):
+        composer = Composer.objects.create(
+            full_name="Frederic Chopin", first_name="Frederic", last_name="Chopin"
+        )
+        self.work = Work.objects.create(
+            work_title="Ballade No. 1",
+            composition_year=1835,
+            opus="Op. 23",
+            composer=composer,
+        )
+
+    def create_puzzle(self, day: int, puzzle_type=Puzzle.PuzzleType.PIANO) -> Puzzle:
+        return Puzzle.objects.create(
+            type=puzzle_type, date=date(2024, 1, day), answer=self.work
+        )
+
+    def sequence_numbers(self, puzzle_type=Puzzle.PuzzleType.PIANO) -> list:
+        return list(
+            Puzzle.objects.filter(type=puzzle_type)
+            .order_by("date")
+            .values_list("date__day", "sequence_number")
+        )
+
+    def test_insert_renumbers_later_puzzles(self):
+        self.create_puzzle(2)
+        self.create_puzzle(5)
+        inserted = self.create_puzzle(1)
+
+        self.assertEqual(inserted.sequence_number, 1)
+        self.assertEqual(self.sequence_numbers(), [(1, 1), (2, 2), (5, 3)])
+
+    def test_move_and_delete_renumber(self):
+        first = self.create_puzzle(1)
+        self.create_puzzle(2)
+        self.create_puzzle(3)
+
+        first.date = date(2024, 1, 4)
+        first.save()
+        self.assertEqual(first.sequence_number, 3)
+        self.assertEqual(self.sequence_numbers(), [(2, 1), (3, 2), (4, 3)])
+
+        # moving to another type renumbers both
+        first.type = Puzzle.PuzzleType.VIOLIN
+        first.save()
+        self.assertEqual(first.sequence_number, 1)
+        self.assertEqual(self.sequence_numbers(), [(2, 1), (3, 2)])
+
+        Puzzle.objects.filter(date__day=2).delete()
+        self.assertEqual(self.sequence_numbers(), [(3, 1)])
+
+    def test_renumber_puzzles_repairs_numbers(self):
+        for day in (1, 2, 3):
+            self.create_puzzle(day)
+        Puzzle.objects.update(sequence_number=None)
+
+        self.assertEqual(renumber_puzzles(Puzzle.PuzzleType.PIANO, date(2024, 1, 2)), 2)
+        self.assertEqual(self.sequence_numbers(), [(1, None), (2, 2), (3, 3)])
+        self.assertEqual(renumber_puzzles(Puzzle.PuzzleType.PIANO), 1)
+        self.assertEqual(renumber_puzzles(Puzzle.PuzzleType.PIANO), 0)
+
+
+class FrontierCacheTest(TestCase):
+    def test_frontier_is_cached_per_live_date(self):
+        invalidate_frontier()
+        # e.g. users on either side of the date line
+        today = timezone.now().date()
+        dates = [today, today + timedelta(days=1)]
+
+        for day in dates:
+            with self.assertNumQueries(1):
+                get_latest_visible_date(Puzzle.PuzzleType.PIANO, day)
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                for day in dates:
+                    get_latest_visible_date(Puzzle.PuzzleType.PIANO, day)
+
+
+class CatalogVersionTest(TestCase):
+    def test_edits_from_other_processes_rebuild_the_catalog(self):
+        composer = Composer.objects.create(
+            full_name="Franz Schubert", first_name="Franz", last_name="Schubert"
+        )
+        work = Work.objects.create(
+            work_title="Winterreise",
+            composition_year=1827,
+            opus="D. 911",
+            composer=composer,
+        )
+        version = get_catalog().version
+
+        # an admin edit on another worker: no signals here, only updated_at moves
+        Work.objects.filter(pk=work.pk).update(
+            composition_year=1828, updated_at=timezone.now()
+        )
+        with mock.patch.object(catalog_snapshot, "check_seconds", 0):
+            catalog = get_catalog()
+        self.assertNotEqual(catalog.version, version)
+        works = json.loads(catalog.body)["composers"][0]["works"]
+        self.assertEqual(works[0]["composition_year"], 1828)
+
+
+class WorksListCacheTest(TestCase):
+    def get_works(self, composer_id: int) -> list:
+        response = self.client.get(f"/api/works/{composer_id}")
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b"".join(response))
+
+    def test_works_changed_without_signals_are_served_fresh(self):
+        bach = Composer.objects.create(
+            full_name="Johann Sebastian Bach", first_name="Johann", last_name="Bach"
+        )
+        handel = Composer.objects.create(
+            full_name="George Frideric Handel", first_name="George", last_name="Handel"
+        )
+        work = Work.objects.create(
+            work_title="Cello Suite No. 1",
+            composition_year=1720,
+            opus="BWV 1007",
+            composer=bach,
+        )
+        self.assertEqual(self.get_works(bach.id)[0]["composition_year"], 1720)
+        self.assertEqual(len(self.get_works(handel.id)), 0)
+
+        # e.g. the scraper or another worker: no signals reach this process
+        Work.objects.filter(pk=work.pk).update(
+            composition_year=1723, updated_at=timezone.now()
+        )
+        # version check only, the cached body is reused
+        with self.assertNumQueries(1):
+            self.get_works(handel.id)
+        self.assertEqual(self.get_works(bach.id)[0]["composition_year"], 1723)
+
+        Work.objects.filter(pk=work.pk).update(
+            composer=handel, updated_at=timezone.now()
+        )
+        self.assertEqual(self.get_works(bach.id), [])
+        self.assertEqual(len(self.get_works(handel.id)), 1)
+
+
+class ComposerETagTest(TestCase):
+    def test_work_stats_changes_invalidate_composer_etags(self):
+        composer = Composer.objects.create(
+            full_name="Clara Schumann", first_name="Clara", last_name="Schumann"
+        )
+        work = Work.objects.create(
+            work_title="Piano Trio",
+            composition_year=1846,
+            opus="Op. 17",
+            composer=composer,
+        )
+        urls = [f"/api/composers/{composer.id}/", "/api/composers/"]
+        etags = [self.client.get(url)["ETag"] for url in urls]
+
+        # an admin edit to a work changes the composer's year range only
+        work.composition_year = 1847
+        work.save()
+        for url, etag in zip(urls, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+        response = self.client.get(urls[0])
+        self.assertEqual(response.json()["max_composition_year"], 1847)
+
+
+class LatestPuzzleCacheTest(TestCase):
+    def setUp(self):
+        composer = Composer.objects.create(
+            full_name="Frederic Chopin", first_name="Frederic", last_name="Chopin"
+        )
+        self.work = Work.objects.create(
+            work_title="Nocturne No. 2",
+            composition_year=1832,
+            opus="Op. 9",
+            composer=composer,
+        )
+        self.puzzle = Puzzle.objects.create(
+            type=Puzzle.PuzzleType.PIANO, date=date(2024, 1, 1), answer=self.work
+        )
+        latest_puzzle_cache.clear()
+
+    def get_latest(self):
+        response = self.client.get("/api/puzzles/piano/latest")
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_hits_are_served_without_queries(self):
+        before = latest_puzzle_cache.stats()
+        self.get_latest()
+        with self.assertNumQueries(0):
+            body = self.get_latest()
+        self.assertEqual(body["id"], self.puzzle.id)
+
+        after = latest_puzzle_cache.stats()
+        self.assertEqual(after["misses"] - before["misses"], 1)
+        self.assertEqual(after["hits"] - before["hits"], 1)
+
+    def test_saves_invalidate_cached_puzzles(self):
+        self.get_latest()
+        self.work.work_title = "Nocturne in E-flat major"
+        self.work.save()
+        self.assertEqual(
+            self.get_latest()["answer"]["work_title"], self.work.work_title
+        )
+
+        self.puzzle.difficulty = Puzzle.DifficultyRating.HARD
+        self.puzzle.save()
+        self.assertEqual(self.get_latest()["difficulty"], Puzzle.DifficultyRating.HARD)
+
+    def test_metrics_are_staff_only(self):
+        self.get_latest()
+        self.assertEqual(self.client.get("/api/metrics").status_code, 403)
+
+        self.client.force_login(
+            User.objects.create_user("admin", is_staff=True, password="x")
+        )
+        response = self.client.get("/api/metrics")
+        self.assertEqual(response.status_code, 200)
+        stats = response.json()["cache.latest_puzzle"]
+        self.assertEqual(stats["entries"], 1)
+        self.assertGreaterEqual(stats["misses"], 1)
+
+
+class PuzzleETagTest(TestCase):
+    def setUp(self):
+        self.composer = Composer.objects.create(
+            full_name="Frederic Chopin", first_name="Frederic", last_name="Chopin"
+        )
+        self.work = Work.objects.create(
+            work_title="Ballade No. 4",
+            composition_year=1842,
+            opus="Op. 52",
+            composer=self.composer,
+        )
+        self.puzzle = Puzzle.objects.create(
+            type=Puzzle.PuzzleType.PIANO, date=date(2024, 1, 1), answer=self.work
+        )
+        self.urls = [
+            "/api/puzzles/piano/latest",
+            "/api/puzzles/piano/1",
+            f"/api/puzzles/{self.puzzle.id}/",
+            "/api/puzzles/",
+        ]
+
+    def etags(self, urls: list[str]) -> dict[str, str]:
+        return {url: self.client.get(url)["ETag"] for url in urls}
+
+    def assert_modified(self, etags: dict[str, str]):
+        for url, etag in etags.items():
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, url)
+
+    def test_unchanged_puzzles_are_not_modified(self):
+        for url, etag in self.etags(self.urls).items():
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, url)
+
+    def test_answer_edits_change_etags(self):
+        work_urls = [f"/api/works/{self.work.id}/", "/api/works/"]
+        etags = self.etags(self.urls + work_urls)
+        self.work.work_title = "Ballade in F minor"
+        self.work.save()
+        self.assert_modified(etags)
+
+    def test_composer_edits_change_etags(self):
+        etags = self.etags(self.urls)
+        self.composer.born_year = 1810
+        self.composer.save()
+        self.assert_modified(etags)
+
+    def test_nested_answer_has_only_the_original_fields(self):
+        for url in ("/api/puzzles/piano/latest", f"/api/puzzles/{self.puzzle.id}/"):
+            answer = self.client.get(url).json()["answer"]
+            self.assertEqual(
+                list(answer),
+                [
+                    "id",
+                    "work_title",
+                    "composition_year",
+                    "opus",
+                    "opus_number",
+                    "composer",
+                    "first_scanned",
+                    "last_scanned",
+                ],
+            )
+            self.assertEqual(
+                list(answer["composer"]),
+                [
+                    "id",
+                    "full_name",
+                    "first_name",
+                    "last_name",
+                    "born_year",
+                    "died_year",
+                    "catalog_prefix",
+                    "first_scanned",
+                    "last_scanned",
+                ],
+            )
+
+
+class PuzzleListQueryTest(TestCase):
+    def create_puzzles(self, count: int, start: date):
+        for i in range(count):
+            composer = Composer.objects.create(
+                full_name=f"Composer {start} {i}",
+                first_name="Composer",
+                last_name=f"{start} {i}",
+            )
+            work = Work.objects.create(
+                work_title=f"Work {i}",
+                composition_year=1800 + i,
+                opus=f"{start} {i}",
+                composer=composer,
+            )
+            Puzzle.objects.create(
+                type=Puzzle.PuzzleType.values[i % len(Puzzle.PuzzleType.values)],
+                date=start + timedelta(days=i),
+                answer=work,
+            )
+
+    def assert_list_queries(self):
+        invalidate_frontier()
+        # etag aggregate, page count, page rows with answer/composer, frontier
+        with self.assertNumQueries(4):
+            response = self.client.get("/api/puzzles/")
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_list_query_count_does_not_grow_with_puzzles(self):
+        self.create_puzzles(5, date(2024, 1, 1))
+        self.assertEqual(self.assert_list_queries()["count"], 5)
+
+        self.create_puzzles(40, date(2025, 1, 1))
+        body = self.assert_list_queries()
+        self.assertEqual(body["count"], 45)
+        self.assertEqual(body["results"][0]["sequence_number"], 1)
+        self.assertIn("composer", body["results"][0]["answer"])
+
+
+class LRUCacheTest(SimpleTestCase):
+    def test_local_entries_expire_after_local_ttl(self):
+        cache = LRUCache("test", max_entries=2, local_ttl=60)
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+
+        with mock.patch("sheet_api.caching.time.monotonic", return_value=1e12):
+            self.assertIsNone(cache.get("a"))
+
+
+class VersionedSnapshotTest(SimpleTestCase):
+    def test_concurrent_first_gets_build_once(self):
+        def build():
+            time.sleep(0.05)
+            return object()
+
+        snapshot = VersionedSnapshot("test", build, lambda: 1)
+        values = []
+        threads = [
+            threading.Thread(target=lambda: values.append(snapshot.get()))
+            for _ in range(8)
+        ]
+        # like wsgi's warm() racing the first requests
+        snapshot.warm()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(snapshot.builds, 1)
+        self.assertEqual(len(set(map(id, values))), 1)
+        self.assertIs(snapshot.get(), values[0])
+
+
+class WorkSearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        dvorak = Composer.objects.create(
+            full_name="Antonín Dvořák", first_name="Antonín", last_name="Dvořák"
+        )
+        beethoven = Composer.objects.create(
+            full_name="Ludwig van Beethoven", first_name="Ludwig", last_name="Beethoven"
+        )
+        cls.works = {}
+        for title, year, opus, composer in [
+            ("Symphony No. 9 in E minor", 1893, "Op. 95", dvorak),
+            ("Slavonic Dances", 1878, "Op. 46", dvorak),
+            ("Symphony No. 9 in D minor", 1824, "Op. 125", beethoven),
+            ("Piano Sonata No. 14 in C-sharp minor", 1801, "Op. 27", beethoven),
+        ]:
+            cls.works[title] = Work.objects.create(
+                work_title=title, composition_year=year, opus=opus, composer=composer
+            )
+
+    def setUp(self):
+        work_index_snapshot.invalidate()
+
+    def search(self, query: str, **kwargs) -> list[str]:
+        return [w.work_title for w in get_work_index().search(query, **kwargs)]
+
+    def test_fold_strips_accents_and_case(self):
+        self.assertEqual(fold("Antonín Dvořák"), "antonin dvorak")
+        self.assertEqual(self.search("dvorak symphony"), self.search("Dvořák Symphony"))
+        self.assertEqual(self.search("dvorak symphony"), ["Symphony No. 9 in E minor"])
+
+    def test_search_ranks_title_prefixes_first(self):
+        self.assertEqual(
+            self.search("symphony no 9"),
+            ["Symphony No. 9 in D minor", "Symphony No. 9 in E minor"],
+        )
+        self.assertEqual(self.search("op27"), ["Piano Sonata No. 14 in C-sharp minor"])
+        beethoven = self.works["Symphony No. 9 in D minor"].composer_id
+        self.assertEqual(
+            self.search("minor", composer_id=beethoven, limit=1),
+            ["Symphony No. 9 in D minor"],
+        )
+
+    def test_typos_fall_back_to_trigrams(self):
+        self.assertEqual(self.search("slavonik dances"), ["Slavonic Dances"])
+        self.assertEqual(self.search("zzzz"), [])
+
+    def test_search_endpoint(self):
+        response = self.client.get("/api/works/search", {"q": "slavonic", "limit": 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]["id"], self.works["Slavonic Dances"].id)
+
+
+class PuzzleGuessTest(TestCase):
+    def setUp(self):
+        mozart = Composer.objects.create(
+            full_name="Wolfgang Amadeus Mozart",
+            first_name="Wolfgang",
+            last_name="Mozart",
+        )
+        self.answer = Work.objects.create(
+            work_title="Eine kleine Nachtmusik",
+            composition_year=1787,
+            opus="K. 525",
+            opus_number=525,
+            composer=mozart,
+        )
+        self.guess = Work.objects.create(
+            work_title="Symphony No. 41",
+            composition_year=1788,
+            opus="K. 551",
+            opus_number=551,
+            composer=mozart,
+        )
+        self.puzzle = Puzzle.objects.create(
+            type=Puzzle.PuzzleType.values[0], date=date(2024, 1, 1), answer=self.answer
+        )
+
+    def post_guess(self, work_id: int):
+        return self.client.post(
+            f"/api/puzzles/{self.puzzle.id}/guess",
+            {"work": work_id},
+            content_type="application/json",
+        )
+
+    def test_guess_is_scored_without_queries(self):
+        work_index_snapshot.get()
+        answer_snapshot.get()
+
+        with self.assertNumQueries(0):
+            response = self.post_guess(self.guess.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            {
+                "work": self.guess.id,
+                "correct": False,
+                "composer_correct": True,
+                "year_difference": -1,
+                "same_catalog": True,
+            },
+        )
+
+        self.assertTrue(self.post_guess(self.answer.id).json()["correct"])
+        self.assertEqual(self.post_guess(-1).status_code, 400)
+
+    def test_scores_exact_close_and_wrong_guesses(self):
+        bach = Composer.objects.create(
+            full_name="Johann Sebastian Bach", first_name="Johann", last_name="Bach"
+        )
+        wrong = Work.objects.create(
+            work_title="Goldberg Variations",
+            composition_year=1741,
+            opus="BWV 988",
+            composer=bach,
+        )
+
+        exact = self.post_guess(self.answer.id).json()
+        self.assertEqual(
+            exact,
+            {
+                "work": self.answer.id,
+                "correct": True,
+                "composer_correct": True,
+                "year_difference": 0,
+                "same_catalog": True,
+            },
+        )
+        close = self.post_guess(self.guess.id).json()
+        self.assertFalse(close["correct"])
+        self.assertTrue(close["composer_correct"])
+        self.assertEqual(close["year_difference"], -1)
+        self.assertEqual(
+            self.post_guess(wrong.id).json(),
+            {
+                "work": wrong.id,
+                "correct": False,
+                "composer_correct": False,
+                "year_difference": 46,
+                "same_catalog": False,
+            },
+        )
+
+    def test_scores_use_years_edited_by_other_processes(self):
+        self.assertEqual(self.post_guess(self.guess.id).json()["year_difference"], -1)
+
+        # an admin edit on another worker, which sends no signals here
+        Work.objects.filter(pk=self.guess.pk).update(
+            composition_year=1790, updated_at=timezone.now()
+        )
+        with mock.patch.object(work_index_snapshot, "check_seconds", 0):
+            result = self.post_guess(self.guess.id).json()
+        self.assertEqual(result["year_difference"], -3)
+
+    def test_usage_events_for_known_puzzles_need_no_queries(self):
+        answer_snapshot.get()
+        event = {"event_type": "puzzle_viewed", "event_body": {}}
+
+        with self.assertNumQueries(0):
+            response = self.client.post(
+                "/api/usage_events",
+                {**event, "puzzle": self.puzzle.id},
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 202)
+
+        # only the unknown id is looked up
+        with self.assertNumQueries(1):
+            response = self.client.post(
+                "/api/usage_events/batch",
+                [{**event, "puzzle": self.puzzle.id}, {**event, "puzzle": -1}],
+                content_type="application/json",
+            )
+        self.assertEqual(response.json()["accepted"], 1)
+        self.assertEqual(response.json()["errors"][0]["index"], 1)
+
+
+class UsageEventBufferTest(TransactionTestCase):
+    def test_flush_drops_only_events_that_fail(self):
+        composer = Composer.objects.create(
+            full_name="Erik Satie", first_name="Erik", last_name="Satie"
+        )
+        work = Work.objects.create(
+            work_title="Gymnopedie No. 1",
+            composition_year=1888,
+            opus="",
+            composer=composer,
+        )
+        puzzle = Puzzle.objects.create(
+            type=Puzzle.PuzzleType.PIANO, date=date(2024, 1, 1), answer=work
+        )
+        viewed = UsageEvent.EventType.PUZZLE_VIEWED
+        events = [make_usage_event(viewed, puzzle.id, {"n": i}) for i in range(7)]
+        # e.g. the puzzle was deleted after the event was validated
+        events.insert(3, make_usage_event(viewed, puzzle.id + 1000, {}))
+
+        buffer = UsageEventBuffer(batch_size=500, flush_seconds=3600, max_pending=100)
+        buffer.add_many(events)
+        self.assertEqual(buffer.flush(), 7)
+
+        self.assertEqual(UsageEvent.objects.count(), 7)
+        self.assertEqual(buffer.stats()["written"], 7)
+        self.assertEqual(buffer.stats()["dropped"], 1)
+        self.assertEqual(buffer.stats()["failed_flushes"], 0)
+
+
+class UsageEventBatchViewTest(TestCase):
+    def test_invalid_events_are_reported_by_index(self):
+        composer = Composer.objects.create(
+            full_name="Erik Satie", first_name="Erik", last_name="Satie"
+        )
+        work = Work.objects.create(
+            work_title="Gymnopedie No. 1",
+            composition_year=1888,
+            opus="",
+            composer=composer,
+        )
+        puzzle = Puzzle.objects.create(
+            type=Puzzle.PuzzleType.PIANO, date=date(2024, 1, 1), answer=work
+        )
+        events = [
+            {"event_type": "puzzle_viewed", "puzzle": puzzle.id, "event_body": {}},
+            {"event_type": "puzzle_viewed", "event_body": {}},
+            {"event_type": "not_an_event", "puzzle": puzzle.id, "event_body": {}},
+            {"event_type": "guess_made", "puzzle": puzzle.id + 1, "event_body": {}},
+            {"event_type": "guess_made", "puzzle": "abc", "event_body": {}},
+            {"event_type": "guess_made", "puzzle": puzzle.id, "event_body": {"n": 1}},
+        ]
+
+        with mock.patch(
+            "sheet_api.api_views.record_usage_events", side_effect=len
+        ) as record:
+            response = self.client.post(
+                "/api/usage_events/batch", events, content_type="application/json"
+            )
+
+        self.assertEqual(response.status_code, 202)
+        body = response.json()
+        self.assertEqual(body["accepted"], 2)
+        self.assertEqual(body["dropped"], 0)
+        self.assertEqual([error["index"] for error in body["errors"]], [1, 2, 3, 4])
+        self.assertIn("puzzle", body["errors"][0]["detail"])
+        self.assertEqual(body["errors"][1]["detail"], "Invalid event type")
+        self.assertEqual(body["errors"][2]["detail"], "Puzzle not found")
+        self.assertEqual(
+            [event.event_body for event in record.call_args.args[0]], [{}, {"n": 1}]
+        )
+
+
+class ExportUsageEventsTest(TestCase):
+    def test_export_to_stdout_writes_one_record_per_line(self):
+        composer = Composer.objects.create(
+            full_name="Erik Satie", first_name="Erik", last_name="Satie"
+        )
+        work = Work.objects.create(
+            work_title="Gnossienne No. 3",
+            composition_year=1890,
+            opus="",
+            composer=composer,
+        )
+        puzzle = Puzzle.objects.create(
+            type=Puzzle.PuzzleType.PIANO, date=date(2024, 1, 1), answer=work
+        )
+        for i in range(3):
+            UsageEvent.objects.create(
+                event_type=UsageEvent.EventType.GUESS_MADE,
+                puzzle=puzzle,
+                event_body={"guess": i},
+            )
+
+        out = io.StringIO()
+        call_command("export_usage_events", stdout=out, stderr=io.StringIO())
+        lines = out.getvalue().split("\n")
+        self.assertEqual(lines[-1], "")
+        rows = [json.loads(line) for line in lines[:-1]]
+        self.assertEqual(
+            [row["event_body"] for row in rows], [{"guess": i} for i in range(3)]
+        )
+
+        out = io.StringIO()
+        call_command(
+            "export_usage_events", "--format", "csv", stdout=out, stderr=io.StringIO()
+        )
+        self.assertEqual(len(out.getvalue().splitlines()), 4)
+
+
+class ExportPuzzleSnapshotsTest(TestCase):
+    def export(self, output_dir: str) -> list:
+        with mock.patch.object(
+            LocalSnapshotStore,
+            "write",
+            autospec=True,
+            side_effect=LocalSnapshotStore.write,
+        ) as write:
+            call_command(
+                "export_puzzle_snapshots",
+                "--output-dir",
+                output_dir,
+                stdout=io.StringIO(),
+            )
+        return sorted(call.args[1] for call in write.call_args_list)
+
+    def test_second_run_only_rewrites_changed_files(self):
+        works = [
+            Work.objects.create(
+                work_title=title,
+                composition_year=1890,
+                opus="",
+                composer=Composer.objects.create(
+                    full_name=full_name,
+                    first_name=full_name.split()[0],
+                    last_name=full_name.split()[1],
+                ),
+            )
+            for title, full_name in (
+                ("Gnossienne No. 1", "Erik Satie"),
+                ("Arabesque No. 1", "Claude Debussy"),
+            )
+        ]
+        today = timezone.now().date()
+        for days_ago, work in zip((2, 1), works):
+            Puzzle.objects.create(
+                type=Puzzle.PuzzleType.PIANO,
+                date=today - timedelta(days=days_ago),
+                answer=work,
+            )
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            written = self.export(output_dir)
+            self.assertIn("puzzles/piano/1.json", written)
+            self.assertIn("puzzles/piano/2.json", written)
+            self.assertFalse(
+                [name for name in os.listdir(output_dir) if name.endswith(".tmp")]
+            )
+
+            # only the manifest itself is written again
+            self.assertEqual(self.export(output_dir), ["manifest.json"])
+
+            works[1].work_title = "Arabesque No. 2"
+            works[1].save()
+            self.assertEqual(
+                self.export(output_dir), ["manifest.json", "puzzles/piano/2.json"]
+            )
+            with open(os.path.join(output_dir, "puzzles/piano/2.json")) as f:
+                body = json.load(f)
+            self.assertEqual(body["answer"]["work_title"], "Arabesque No. 2")
+
+
+class PuzzleStatsRollupTest(TestCase):
+    def test_rollups_add_up_and_touch_updated_at(self):
+        composer = Composer.objects.create(
+            full_name="Erik Satie", first_name="Erik", last_name="Satie"
+        )
+        work = Work.objects.create(
+            work_title="Gnossienne No. 1",
+            composition_year=1890,
+            opus="",
+            composer=composer,
+        )
+        puzzle = Puzzle.objects.create(
+            type=Puzzle.PuzzleType.PIANO, date=date(2024, 1, 1), answer=work
+        )
+
+        def add_event(event_type, body=None):
+            UsageEvent.objects.create(
+                event_type=event_type,
+                puzzle=puzzle,
+                event_body=body or {},
+                event_time=timezone.now() - timedelta(minutes=5),
+            )
+
+        add_event(UsageEvent.EventType.PUZZLE_VIEWED)
+        add_event(UsageEvent.EventType.PUZZLE_SOLVED, {"guesses": 3})
+        self.assertEqual(rollup_puzzle_stats(), 2)
+        first_update = PuzzleStats.objects.get(puzzle=puzzle).updated_at
+
+        add_event(UsageEvent.EventType.PUZZLE_VIEWED)
+        self.assertEqual(rollup_puzzle_stats(), 1)
+        self.assertEqual(rollup_puzzle_stats(), 0)
+
+        stats = PuzzleStats.objects.get(puzzle=puzzle)
+        self.assertEqual((stats.views, stats.solves), (2, 1))
+        self.assertEqual(stats.solve_guess_counts, {"3": 1})
+        self.assertGreater(stats.updated_at, first_update)
+
+
+class PartitionHelpersTest(SimpleTestCase):
+    def test_months_and_bounds(self):
+        self.assertEqual(add_months(date(2024, 11, 1), 2), date(2025, 1, 1))
+        self.assertEqual(add_months(date(2024, 1, 1), -1), date(2023, 12, 1))
+        self.assertEqual(add_months(date(2024, 3, 1), -15), date(2022, 12, 1))
+
+        start, end = month_bounds(date(2024, 12, 1))
+        self.assertEqual((start.year, start.month, start.day), (2024, 12, 1))
+        self.assertEqual((end.year, end.month, end.day), (2025, 1, 1))
+        self.assertEqual(start.utcoffset(), timedelta(0))
+
+    def test_partition_names_round_trip(self):
+        name = partition_name(date(2024, 3, 1))
+        self.assertEqual(name, "sheet_api_usageevent_p2024_03")
+        self.assertEqual(PARTITION_NAME_RE.match(name).groups(), ("2024", "03"))
+        self.assertIsNone(PARTITION_NAME_RE.match("sheet_api_usageevent_default"))
+
+    def test_expired_months_keep_whole_months_before_the_current_one(self):
+        months = [date(2024, month, 1) for month in range(1, 13)]
+        self.assertEqual(
+            expired_months(months, date(2024, 8, 17), keep_months=6),
+            [date(2024, 1, 1)],
+        )
+        self.assertEqual(expired_months(months, date(2024, 8, 17), 12), [])
+        self.assertEqual(len(expired_months(months, date(2025, 1, 1), 0)), 12)
+
+
+@skipIf(connection.vendor == "postgresql", "usage events are partitioned")
+class PruneWithoutPartitionsTest(TestCase):
+    def test_prune_needs_a_partitioned_table(self):
+        self.assertFalse(is_partitioned())
+        with self.assertRaises(CommandError):
+            call_command("prune_usage_events", stdout=io.StringIO())
+
+
+@skipUnless(connection.vendor == "postgresql", "partitioning needs PostgreSQL")
+class PrunePartitionsTest(TestCase):
+    def setUp(self):
+        composer = Composer.objects.create(
+            full_name="Erik Satie", first_name="Erik", last_name="Satie"
+        )
+        work = Work.objects.create(
+            work_title="Vexations", composition_year=1893, opus="", composer=composer
+        )
+        self.puzzle = Puzzle.objects.create(
+            type=Puzzle.PuzzleType.PIANO, date=date(2024, 1, 1), answer=work
+        )
+        this_month = timezone.now().date().replace(day=1)
+        self.old_month = add_months(this_month, -12)
+        create_partition(self.old_month)
+        self.event = UsageEvent.objects.create(
+            event_type=UsageEvent.EventType.PUZZLE_VIEWED,
+            puzzle=self.puzzle,
+            event_body={},
+            event_time=month_bounds(self.old_month)[0] + timedelta(days=1),
+        )
+        self.archive_dir = tempfile.mkdtemp()
+
+    def prune(self, *args) -> str:
+        out = io.StringIO()
+        call_command(
+            "prune_usage_events",
+            "--archive-dir",
+            self.archive_dir,
+            *args,
+            stdout=out,
+            stderr=out,
+        )
+        return out.getvalue()
+
+    def test_migrated_table_is_partitioned(self):
+        self.assertTrue(is_partitioned())
+        self.assertIn(timezone.now().date().replace(day=1), list_partitions())
+
+    def test_prune_waits_for_the_rollup(self):
+        self.assertIn("run rollup_puzzle_stats first", self.prune())
+        self.assertIn(self.old_month, list_partitions())
+
+    def test_prune_archives_and_drops_expired_partitions(self):
+        self.assertIn("Would archive", self.prune("--dry-run"))
+        self.assertIn(self.old_month, list_partitions())
+
+        RollupCursor.objects.create(
+            name=PUZZLE_STATS_CURSOR, last_event_id=self.event.id
+        )
+        self.prune()
+        self.assertNotIn(self.old_month, list_partitions())
+        self.assertIn(timezone.now().date().replace(day=1), list_partitions())
+
+        path = os.path.join(
+            self.archive_dir, f"{partition_name(self.old_month)}.ndjson.gz"
+        )
+        with gzip.open(path, "rt") as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual([row["id"] for row in rows], [self.event.id])
+
+
+class BulkSaveWorksTest(TestCase):
+    def scraped(self, title: str, year: int, opus: str, last_name="Mozart"):
+        return ScrapedWork(
+            composer_firstname="Wolfgang",
+            composer_lastname=last_name,
+            composer_fullname=f"Wolfgang {last_name}",
+            work_title=title,
+            composition_year=year,
+            opus=opus,
+            opus_number=-1,
+        )
+
+    def test_bulk_save_diffs_against_existing_works(self):
+        parser = Parser(writes_to_db=True)
+        parser.save_composer_works(
+            [
+                self.scraped("Serenade", 1787, "K. 525"),
+                self.scraped("Rondo", 1786, "K. 485"),
+            ]
+        )
+        # owned by another composer, so it can't be claimed
+        parser.save_composer_works([self.scraped("Minuet", 1790, "K. 1", "Other")])
+
+        works = [
+            self.scraped("Serenade", 1787, "K. 525"),
+            self.scraped("Rondo", 1787, "K. 485"),
+            self.scraped("Minuet", 1790, "K. 1"),
+            *(self.scraped(f"Sonata {i}", 1780, f"K. {600 + i}") for i in range(50)),
+        ]
+        # savepoint and release, composer, existing works, insert, update,
+        # rescanned works, insert conflicts, composer stats (2), however many works
+        # there are
+        with self.assertNumQueries(10):
+            counts = parser.save_composer_works(works)
+
+        self.assertEqual(
+            counts, {"added": 50, "updated": 1, "unchanged": 1, "skipped": 1}
+        )
+        self.assertEqual(Work.objects.get(work_title="Rondo").composition_year, 1787)
+        self.assertEqual(Composer.objects.get(last_name="Mozart").work_count, 52)
+
+    def test_works_added_by_a_concurrent_scan_are_not_counted_as_added(self):
+        parser = Parser(writes_to_db=True)
+        parser.save_composer_works([self.scraped("Serenade", 1787, "K. 525")])
+        composer = Composer.objects.get(last_name="Mozart")
+        bulk_create = Work.objects.bulk_create
+
+        def racing_bulk_create(works, **kwargs):
+            # another scan inserts one of them after our diff
+            Work.objects.create(
+                work_title="Rondo",
+                composition_year=1786,
+                opus="K. 485",
+                opus_number=-1,
+                composer=composer,
+            )
+            return bulk_create(works, **kwargs)
+
+        works = [
+            self.scraped("Rondo", 1786, "K. 485"),
+            self.scraped("Fantasia", 1785, "K. 475"),
+        ]
+        with mock.patch.object(Work.objects, "bulk_create", racing_bulk_create):
+            counts = parser.save_composer_works(works)
+
+        self.assertEqual(counts["added"], 1)
+        self.assertEqual(counts["skipped"], 1)
+        self.assertEqual(Work.objects.filter(work_title="Rondo").count(), 1)
+
+
+class UnchangedComposerSkipTest(TestCase):
+    def setUp(self):
+        parser = Parser()
+        # a composer scraped from IMSLP without overrides
+        self.composer = next(
+            c for c in parser.composer_list if c not in scraper.config_by_composer
+        )
+        self.page = synthetic_works_page(3).decode()
+        patcher = mock.patch.object(
+            scraper, "get_page_text", side_effect=lambda url: self.page
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def scrape(self, **kwargs) -> int:
+        """
+        Scan the composer, returning how many times a parsed page was saved.
+        """
+        parser = Parser(writes_to_db=True)
+        with mock.patch.object(
+            Parser, "_save_scrape", autospec=True, side_effect=Parser._save_scrape
+        ) as save, contextlib.redirect_stdout(io.StringIO()):
+            failed = parser.scrape_all_composers(1, [self.composer], **kwargs)
+        self.assertEqual(failed, [])
+        return save.call_count
+
+    def test_unchanged_pages_are_skipped(self):
+        self.assertEqual(self.scrape(), 1)
+        self.assertEqual(Work.objects.count(), 3)
+        self.assertEqual(self.scrape(), 0)
+
+        # comments carry render times, which don't count as changes
+        self.page = self.page.replace("</body>", "<!-- 12:00 --></body>")
+        self.assertEqual(self.scrape(), 0)
+
+        self.page = synthetic_works_page(4).decode()
+        self.assertEqual(self.scrape(), 1)
+        self.assertEqual(Work.objects.count(), 4)
+
+    def test_force_and_parser_changes_rescan(self):
+        self.scrape()
+        self.assertEqual(self.scrape(force=True), 1)
+
+        with mock.patch.object(
+            scraper, "parser_config_version", return_value="edited parser"
+        ):
+            self.assertEqual(self.scrape(), 1)
+            self.assertEqual(self.scrape(), 0)
+
+        with mock.patch.object(
+            Parser, "_save_scrape", autospec=True
+        ) as save, contextlib.redirect_stdout(io.StringIO()):
+            call_command(
+                "scrape_composers",
+                "--composer",
+                self.composer,
+                "--force",
+                stdout=io.StringIO(),
+            )
+        self.assertEqual(save.call_count, 1)
+
+    def test_pages_without_works_are_remembered(self):
+        self.scrape()
+        self.page = synthetic_works_page(0).decode()
+        self.assertEqual(self.scrape(), 1)
+        self.assertEqual(self.scrape(), 0)
+
+
+class PageFetchTest(SimpleTestCase):
+    """
+    get_page_text against a local server that serves synthetic_works_page with an
+    ETag, after answering with the statuses queued in self.failures.
+    """
+
+    def setUp(self):
+        self.body = synthetic_works_page(3)
+        self.failures = []
+        self.seen_headers = []
+        test = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                test.seen_headers.append(dict(self.headers))
+                if test.failures:
+                    self.send_response(test.failures.pop(0))
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                etag = '"' + hashlib.sha1(test.body).hexdigest() + '"'
+                if self.headers.get("If-None-Match", None) == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(test.body)))
+                self.end_headers()
+                self.wfile.write(test.body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.url = f"http://127.0.0.1:{server.server_port}/wiki/List_of_works_by_Satie"
+
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache_dir = cache_dir.name
+
+        for patch in (
+            mock.patch.object(page_helpers, "page_cache", None),
+            mock.patch.object(page_helpers, "offline", False),
+            mock.patch.object(
+                page_helpers, "host_rate_limiter", page_helpers.HostRateLimiter(0, 4)
+            ),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+        page_helpers.configure_page_cache(self.cache_dir)
+        page_helpers.fetch_stats.reset()
+        self.addCleanup(page_helpers.fetch_stats.reset)
+
+    def test_unchanged_page_is_revalidated(self):
+        self.assertEqual(page_helpers.get_page_text(self.url), self.body.decode())
+        cached = page_helpers.page_cache.lookup(self.url)
+        self.assertIsNotNone(cached)
+
+        with mock.patch.object(
+            page_helpers.page_cache, "touch", wraps=page_helpers.page_cache.touch
+        ) as touch:
+            self.assertEqual(page_helpers.get_page_text(self.url), self.body.decode())
+        touch.assert_called_once()
+        self.assertEqual(self.seen_headers[-1]["If-None-Match"], cached.etag)
+        self.assertEqual(page_helpers.fetch_stats.revalidated, 1)
+
+        # a changed page comes back with a 200 and replaces the cached body
+        self.body = synthetic_works_page(4)
+        self.assertEqual(page_helpers.get_page_text(self.url), self.body.decode())
+        self.assertNotEqual(
+            page_helpers.page_cache.lookup(self.url).body_hash, cached.body_hash
+        )
+        self.assertEqual(page_helpers.fetch_stats.revalidated, 1)
+        self.assertEqual(page_helpers.fetch_stats.requests, 3)
+
+    def test_offline_replays_from_the_cache(self):
+        page_helpers.get_page_text(self.url)
+        page_helpers.configure_page_cache(self.cache_dir, replay_only=True)
+
+        self.assertEqual(page_helpers.get_page_text(self.url), self.body.decode())
+        with self.assertRaises(PageNotCached):
+            page_helpers.get_page_text(self.url + "_Erik")
+        self.assertEqual(len(self.seen_headers), 1)
+        self.assertEqual(page_helpers.fetch_stats.replayed, 1)
+
+    def test_throttled_and_unavailable_responses_are_retried(self):
+        self.failures = [429, 503, 503]
+        with mock.patch("urllib3.util.retry.time.sleep") as sleep:
+            self.assertEqual(page_helpers.get_page_text(self.url), self.body.decode())
+
+        # at once, then 1s, 2s
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [1.0, 2.0])
+        self.assertEqual(page_helpers.fetch_stats.retries, 3)
+        self.assertEqual(page_helpers.fetch_stats.failed, 0)
+
+        self.failures = [503] * 5
+        with mock.patch("urllib3.util.retry.time.sleep"):
+            with self.assertRaisesMessage(Exception, "Status (503)"):
+                page_helpers.get_page_text(self.url)
+        self.assertEqual(page_helpers.fetch_stats.failed, 1)
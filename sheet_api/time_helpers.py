@@ -1,16 +1,80 @@
-from datetime import datetime, date
+from __future__ import annotations
+
+import functools
+import time
+from dataclasses import dataclass
+from datetime import datetime, date, timedelta, tzinfo
 
 import pytz
 
 DEFAULT_TIMEZONE = "America/New_York"
+# user supplied timezone strings are cached, so keep the cache bounded
+TIMEZONE_CACHE_SIZE = 512
 
+# timezone name -> (current local date, unix timestamp of the next local midnight)
+_rollover_table: dict[str, tuple[date, float]] = {}
 
-def get_timezone_aware_date(timezone: str = DEFAULT_TIMEZONE) -> date:
+
+@functools.lru_cache(maxsize=TIMEZONE_CACHE_SIZE)
+def get_timezone(timezone: str | None = DEFAULT_TIMEZONE) -> tzinfo:
     timezone = DEFAULT_TIMEZONE if timezone is None else timezone
     try:
-        tz_obj = pytz.timezone(timezone)
+        return pytz.timezone(timezone)
     except pytz.exceptions.UnknownTimeZoneError:
         print(f"Got unknown timezone: {timezone}")
-        tz_obj = pytz.timezone(DEFAULT_TIMEZONE)
+        return pytz.timezone(DEFAULT_TIMEZONE)
+
+
+def _get_rollover_entry(tz_obj: tzinfo) -> tuple[date, float]:
+    now = time.time()
+    entry = _rollover_table.get(tz_obj.zone)
+    if entry is not None and now < entry[1]:
+        return entry
+
+    today = datetime.fromtimestamp(now, tz=tz_obj).date()
+    next_midnight = tz_obj.localize(
+        datetime.combine(today + timedelta(days=1), datetime.min.time())
+    )
+    entry = (today, next_midnight.timestamp())
+    _rollover_table[tz_obj.zone] = entry
+    return entry
+
+
+def get_timezone_aware_date(timezone: str = DEFAULT_TIMEZONE) -> date:
+    return _get_rollover_entry(get_timezone(timezone))[0]
+
+
+def get_next_rollover(timezone: str = DEFAULT_TIMEZONE) -> datetime:
+    """
+    When the local date in this timezone next changes, as an aware UTC datetime.
+    """
+    timestamp = _get_rollover_entry(get_timezone(timezone))[1]
+    return datetime.fromtimestamp(timestamp, tz=pytz.utc)
+
+
+@dataclass(frozen=True)
+class RequestClock:
+    timezone: str
+    today: date
+    next_rollover: datetime
+
+
+def get_request_clock(timezone: str | None = None) -> RequestClock:
+    tz_obj = get_timezone(timezone)
+    today, rollover_timestamp = _get_rollover_entry(tz_obj)
+    return RequestClock(
+        timezone=tz_obj.zone,
+        today=today,
+        next_rollover=datetime.fromtimestamp(rollover_timestamp, tz=pytz.utc),
+    )
+
 
-    return datetime.now(tz=tz_obj).date()
+def get_request_date(request=None) -> date:
+    """
+    The user's local date for this request, as resolved once by RequestClockMiddleware.
+    Falls back to the default timezone when there is no request (e.g. in scripts).
+    """
+    clock = getattr(request, "clock", None)
+    if clock is None:
+        return get_timezone_aware_date()
+    return clock.today
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import csv
+import json
+from typing import IO, Iterator
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import QuerySet
+
+USAGE_EVENT_EXPORT_FIELDS = [
+    "id",
+    "event_type",
+    "puzzle_id",
+    "session_id",
+    "event_time",
+    "event_body",
+]
+EXPORT_CHUNK_SIZE = 5000
+
+
+def iter_usage_event_rows(
+    events: QuerySet, chunk_size: int = EXPORT_CHUNK_SIZE
+) -> Iterator[dict]:
+    """
+    Rows of events as dicts, fetched chunk_size at a time (a server side cursor on
+    PostgreSQL) so exports don't hold the whole table in memory.
+    """
+    return (
+        events.order_by("id")
+        .values(*USAGE_EVENT_EXPORT_FIELDS)
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def write_ndjson(rows: Iterator[dict], out: IO[str]) -> int:
+    """
+    Write one JSON object per line. Returns the number of rows written.
+    """
+    count = 0
+    for row in rows:
+        # one write per line: management command stdout appends a newline to any
+        # write that doesn't already end with one
+        out.write(json.dumps(row, cls=DjangoJSONEncoder) + "\n")
+        count += 1
+    return count
+
+
+def write_csv(rows: Iterator[dict], out: IO[str]) -> int:
+    """
+    Write rows as CSV with a header, event_body as a JSON string. Returns the number
+    of rows written.
+    """
+    writer = csv.DictWriter(out, fieldnames=USAGE_EVENT_EXPORT_FIELDS)
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        row["event_time"] = row["event_time"].isoformat()
+        row["event_body"] = json.dumps(row["event_body"], cls=DjangoJSONEncoder)
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+WRITERS = {"ndjson": write_ndjson, "csv": write_csv}
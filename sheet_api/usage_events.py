@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import atexit
+import os
+import threading
+
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from sheet_api.metrics import register_collector
+from sheet_api.models import UsageEvent
+from sheet_musicle_server.settings import (
+    SKIP_USAGE_EVENT_WRITE,
+    USAGE_EVENT_BATCH_SIZE,
+    USAGE_EVENT_FLUSH_SECONDS,
+    USAGE_EVENT_MAX_PENDING,
+)
+
+
+class UsageEventBuffer:
+    """
+    Collects usage events in memory and writes them with bulk_create from a background
+    thread, once batch_size events are waiting or flush_seconds have passed.
+
+    Requests never wait on the database. The price is that events still in the buffer
+    are lost if the worker is killed outright; a normal shutdown flushes them. Once
+    max_pending events are waiting (e.g. the database is down) new events are dropped
+    and counted rather than growing the worker's memory without bound.
+    """
+
+    def __init__(self, batch_size: int, flush_seconds: float, max_pending: int):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+
+        self._pending: list[UsageEvent] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        # the flusher thread doesn't survive a fork, so it's started per process
+        self._flusher_pid = None
+
+        self.accepted = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+
+    def add(self, event: UsageEvent) -> bool:
+        return self.add_many([event]) == 1
+
+    def add_many(self, events: list[UsageEvent]) -> int:
+        """
+        Buffer as many of events as fit. Returns how many were accepted.
+        """
+        with self._lock:
+            room = max(0, self.max_pending - len(self._pending))
+            accepted = events[:room]
+            self._pending.extend(accepted)
+            self.accepted += len(accepted)
+            self.dropped += len(events) - len(accepted)
+            pending = len(self._pending)
+
+        self._ensure_flusher()
+        if pending >= self.batch_size:
+            self._wake.set()
+        return len(accepted)
+
+    def flush(self) -> int:
+        """
+        Write everything currently buffered. Returns the number of events written.
+        """
+        # one flush at a time, so batches are written in the order they were taken
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+
+            try:
+                written = self._write(batch)
+            except Exception as e:
+                # the batch is lost, but a broken database must not take the worker
+                # down with it
+                print(f"Could not write {len(batch)} usage events: {e}")
+                with self._lock:
+                    self.failed_flushes += 1
+                    self.dropped += len(batch)
+                return 0
+
+            with self._lock:
+                self.written += written
+            return written
+
+    def _write(self, batch: list[UsageEvent]) -> int:
+        """
+        Insert batch, splitting it in halves on IntegrityError (e.g. an event for a
+        puzzle deleted since it was validated) so only the bad rows are dropped.
+        Returns the number of events written.
+        """
+        try:
+            # foreign keys are checked when this commits
+            with transaction.atomic():
+                UsageEvent.objects.bulk_create(batch, batch_size=self.batch_size)
+            return len(batch)
+        except IntegrityError as e:
+            # ids may have been assigned before the rollback
+            for event in batch:
+                event.pk = None
+            if len(batch) == 1:
+                print(f"Dropping usage event for puzzle {batch[0].puzzle_id}: {e}")
+                with self._lock:
+                    self.dropped += 1
+                return 0
+
+            middle = len(batch) // 2
+            return self._write(batch[:middle]) + self._write(batch[middle:])
+
+    def _ensure_flusher(self):
+        if self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            # drop connections the database closed while we were idle
+            close_old_connections()
+            self.flush()
+
+    def stats(self) -> dict:
+        # request threads and the flusher update these together, read them as one
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "accepted": self.accepted,
+                "written": self.written,
+                "dropped": self.dropped,
+                "failed_flushes": self.failed_flushes,
+            }
+
+
+usage_event_buffer = UsageEventBuffer(
+    USAGE_EVENT_BATCH_SIZE, USAGE_EVENT_FLUSH_SECONDS, USAGE_EVENT_MAX_PENDING
+)
+register_collector("usage_events", usage_event_buffer.stats)
+# gunicorn workers exit through sys.exit on a graceful shutdown, which runs this
+atexit.register(usage_event_buffer.flush)
+
+
+def make_usage_event(
+    event_type: UsageEvent.EventType,
+    puzzle_id: int,
+    event_body,
+    session_id: str | None = None,
+) -> UsageEvent:
+    return UsageEvent(
+        event_type=event_type,
+        puzzle_id=puzzle_id,
+        event_body=event_body,
+        session_id=session_id,
+        event_time=timezone.now(),
+    )
+
+
+def record_usage_events(events: list[UsageEvent]) -> int:
+    """
+    Queue usage events to be written, in one insert unless the buffer flushes in
+    between. Returns how many were accepted; the rest were dropped.
+    """
+    if SKIP_USAGE_EVENT_WRITE:
+        for event in events:
+            print(
+                f"Got usage event: {event.event_type} for puzzle {event.puzzle_id}: {event.session_id} - {event.event_body}"
+            )
+        return len(events)
+
+    return usage_event_buffer.add_many(events)
+
+
+def record_usage_event(
+    event_type: UsageEvent.EventType,
+    puzzle_id: int,
+    event_body,
+    session_id: str | None = None,
+) -> bool:
+    """
+    Queue a usage event to be written. Returns False if it had to be dropped.
+    """
+    event = make_usage_event(event_type, puzzle_id, event_body, session_id)
+    return record_usage_events([event]) == 1
@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import heapq
+import re
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Iterator
+
+from sheet_api.caching import VersionedSnapshot
+from sheet_api.composer_helpers import work_tables_version
+from sheet_api.models import Composer, Work
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+DEFAULT_SEARCH_LIMIT = 10
+# shorter queries only match the start of titles, since a one letter prefix matches
+# most of the vocabulary
+MIN_TOKEN_SEARCH_LENGTH = 2
+
+
+def fold(text: str) -> str:
+    """
+    Lowercase and strip accents, so "Dvořák" and "dvorak" index the same.
+    """
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_RE.findall(fold(text))
+
+
+def trigrams(text: str) -> set[str]:
+    padded = f"  {fold(text)} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass(frozen=True)
+class IndexedWork:
+    id: int
+    composer_id: int
+    work_title: str
+    composition_year: int
+    opus: str
+    opus_number: int | None
+    folded_title: str
+    tokens: frozenset[str]
+
+    def as_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "composer_id": self.composer_id,
+            "work_title": self.work_title,
+            "composition_year": self.composition_year,
+            "opus": self.opus,
+            "opus_number": self.opus_number,
+        }
+
+
+class _TokenPostings:
+    """
+    Sorted vocabulary of tokens, each with the ranks of the works containing it in
+    ascending order, plus every folded title in sorted order.
+    """
+
+    def __init__(self, works_by_rank: list[IndexedWork], ranks: list[int]):
+        postings = defaultdict(list)
+        for rank in ranks:
+            for token in works_by_rank[rank].tokens:
+                postings[token].append(rank)
+
+        self.vocabulary = sorted(postings)
+        self.postings = [postings[token] for token in self.vocabulary]
+        # posting_totals[i] is the number of entries in postings[:i]
+        self.posting_totals = [0]
+        for posting in self.postings:
+            self.posting_totals.append(self.posting_totals[-1] + len(posting))
+
+        self.titles = sorted((works_by_rank[rank].folded_title, rank) for rank in ranks)
+
+    def prefix_range(self, prefix: str) -> tuple[int, int]:
+        start = bisect_left(self.vocabulary, prefix)
+        # "\uffff" sorts after any character a folded token can contain
+        end = bisect_left(self.vocabulary, prefix + "\uffff", lo=start)
+        return start, end
+
+    def prefix_size(self, prefix: str) -> int:
+        start, end = self.prefix_range(prefix)
+        return self.posting_totals[end] - self.posting_totals[start]
+
+    def prefix_ranks(self, prefix: str) -> Iterator[int]:
+        """
+        Ranks of works with a token starting with prefix, best first. A work can be
+        yielded more than once if several of its tokens match.
+        """
+        start, end = self.prefix_range(prefix)
+        return heapq.merge(*self.postings[start:end])
+
+
+class WorkIndex:
+    """
+    In-memory search over every work's title, catalog number and composer name.
+
+    Works are given a static rank (shorter titles first). Results are, in order:
+    works whose title starts with the query (alphabetically), then works where every
+    query token prefix-matches one of their tokens (by rank). Both come out of sorted
+    lists, so a search stops as soon as it has enough results instead of scoring every
+    match. If nothing matches, e.g. because of a typo, works are ranked by how many
+    title trigrams they share with the query instead.
+    """
+
+    def __init__(self, works: list[IndexedWork]):
+        self.works = {work.id: work for work in works}
+        self._works_by_rank = sorted(
+            works, key=lambda w: (len(w.folded_title), w.folded_title, w.id)
+        )
+
+        all_ranks = list(range(len(self._works_by_rank)))
+        self._postings = _TokenPostings(self._works_by_rank, all_ranks)
+        ranks_by_composer = defaultdict(list)
+        for rank, work in enumerate(self._works_by_rank):
+            ranks_by_composer[work.composer_id].append(rank)
+        self._postings_by_composer = {
+            composer_id: _TokenPostings(self._works_by_rank, ranks)
+            for composer_id, ranks in ranks_by_composer.items()
+        }
+
+        self._trigrams = defaultdict(list)
+        for work in works:
+            for trigram in trigrams(work.work_title):
+                self._trigrams[trigram].append(work.id)
+
+    def search(
+        self,
+        query: str,
+        composer_id: int | None = None,
+        limit: int = DEFAULT_SEARCH_LIMIT,
+    ) -> list[IndexedWork]:
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            return []
+
+        if composer_id is None:
+            postings = self._postings
+        elif composer_id in self._postings_by_composer:
+            postings = self._postings_by_composer[composer_id]
+        else:
+            return []
+
+        folded_query = " ".join(query_tokens)
+        results = []
+        seen = set()
+
+        # titles starting with the query
+        i = bisect_left(postings.titles, (folded_query,))
+        while len(results) < limit and i < len(postings.titles):
+            title, rank = postings.titles[i]
+            if not title.startswith(folded_query):
+                break
+            results.append(self._works_by_rank[rank])
+            seen.add(rank)
+            i += 1
+
+        # every query token prefix-matches a token of the work. walk the postings of
+        # the most selective token and check the others on each work
+        if len(results) < limit and len(folded_query) >= MIN_TOKEN_SEARCH_LENGTH:
+            query_tokens.sort(key=postings.prefix_size)
+            for rank in postings.prefix_ranks(query_tokens[0]):
+                if rank in seen:
+                    continue
+                seen.add(rank)
+
+                work = self._works_by_rank[rank]
+                if all(
+                    any(t.startswith(q) for t in work.tokens) for q in query_tokens[1:]
+                ):
+                    results.append(work)
+                    if len(results) >= limit:
+                        break
+
+        if not results:
+            return self._trigram_search(query, composer_id, limit)
+        return results
+
+    def _trigram_search(
+        self, query: str, composer_id: int | None, limit: int
+    ) -> list[IndexedWork]:
+        query_trigrams = trigrams(query)
+        scores = defaultdict(int)
+        for trigram in query_trigrams:
+            for work_id in self._trigrams.get(trigram, ()):
+                scores[work_id] += 1
+
+        if composer_id is not None:
+            scores = {
+                work_id: score
+                for work_id, score in scores.items()
+                if self.works[work_id].composer_id == composer_id
+            }
+
+        # require at least half of the query's trigrams so noise doesn't match
+        threshold = max(1, len(query_trigrams) // 2)
+        best = heapq.nsmallest(
+            limit,
+            (item for item in scores.items() if item[1] >= threshold),
+            key=lambda item: (-item[1], item[0]),
+        )
+        return [self.works[work_id] for work_id, _ in best]
+
+
+def build_work_index() -> WorkIndex:
+    composer_names = dict(Composer.objects.values_list("id", "full_name"))
+    rows = Work.objects.values(
+        "id", "composer_id", "work_title", "composition_year", "opus", "opus_number"
+    )
+
+    works = []
+    for row in rows.iterator(chunk_size=2000):
+        tokens = set(tokenize(row["work_title"]))
+        tokens.update(tokenize(row["opus"]))
+        # catalog numbers are often typed without punctuation, e.g. "k525", "op27"
+        compact_opus = "".join(tokenize(row["opus"]))
+        if compact_opus:
+            tokens.add(compact_opus)
+        if row["opus_number"] is not None and row["opus_number"] >= 0:
+            tokens.add(str(row["opus_number"]))
+        tokens.update(tokenize(composer_names.get(row["composer_id"], "")))
+
+        works.append(
+            IndexedWork(
+                folded_title=" ".join(tokenize(row["work_title"])),
+                tokens=frozenset(tokens),
+                **row,
+            )
+        )
+
+    return WorkIndex(works)
+
+
+work_index_snapshot = VersionedSnapshot(
+    "work_index", build_work_index, work_tables_version
+)
+
+
+def get_work_index() -> WorkIndex:
+    return work_index_snapshot.get()
+
+
+def invalidate_work_index():
+    work_index_snapshot.invalidate()
@@ -79,6 +79,7 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "django.middleware.gzip.GZipMiddleware",
+    "sheet_api.middleware.RequestClockMiddleware",
     # "silk.middleware.SilkyMiddleware",
 ]
 
@@ -217,3 +218,35 @@ if ENV == "prod":
 else:
     HIDE_NEW_PUZZLES = False
     SKIP_USAGE_EVENT_WRITE = True
+
+# number of (category, date) responses each worker keeps for the latest puzzle endpoint
+LATEST_PUZZLE_CACHE_SIZE = 64
+# seconds a worker reuses its own copy of those, since changes made by other processes
+# (the scraper, admin edits on another worker) only reach it through SHARED_CACHE_ALIAS
+LATEST_PUZZLE_CACHE_LOCAL_SECONDS = 60
+# number of composers whose rendered works list each worker keeps
+COMPOSER_WORKS_CACHE_SIZE = 256
+# optional name of a cache in CACHES (e.g. redis) that response caches share between workers
+SHARED_CACHE_ALIAS = os.getenv("SM_SHARED_CACHE_ALIAS")
+# usage events are buffered per worker and written in batches of this size...
+USAGE_EVENT_BATCH_SIZE = 500
+# ...or after this many seconds, whichever comes first
+USAGE_EVENT_FLUSH_SECONDS = 2.0
+# events beyond this many waiting to be written are dropped (and counted)
+USAGE_EVENT_MAX_PENDING = 20000
+# politeness limits for the scraper, per host: time between request starts...
+SCRAPER_MIN_REQUEST_INTERVAL = float(
+    os.getenv("SM_SCRAPER_MIN_REQUEST_INTERVAL", "0.5")
+)
+# ...and requests in flight at once
+SCRAPER_MAX_REQUESTS_PER_HOST = int(os.getenv("SM_SCRAPER_MAX_REQUESTS_PER_HOST", "4"))
+# seconds to wait for the scraper's connections and for a response to start arriving
+SCRAPER_CONNECT_TIMEOUT = 5
+SCRAPER_READ_TIMEOUT = 30
+# retries for failed connections and 429/5xx responses, with exponential backoff
+SCRAPER_MAX_RETRIES = 4
+# directory where scraped pages are cached and revalidated (e.g. .scraper_cache),
+# disabled if unset
+SCRAPER_CACHE_DIR = os.getenv("SM_SCRAPER_CACHE_DIR")
+# only replay pages from the cache, never touching the network
+SCRAPER_OFFLINE = os.getenv("SM_SCRAPER_OFFLINE", "") == "1"
@@ -34,20 +34,31 @@ urlpatterns = [
     path("api-auth/", include("rest_framework.urls", namespace="rest_framework")),
     path("api/", include(router.urls)),
     path("api/works/<int:composer_id>", api_views.WorkFilterView.as_view()),
+    path("api/works/search", api_views.WorkSearchView.as_view()),
     path(
         "api/composers/<int:composer_id>/range",
         api_views.ComposerWorkRangeView.as_view(),
     ),
+    path("api/puzzles/<int:puzzle_id>/guess", api_views.PuzzleGuessView.as_view()),
+    path("api/puzzles/<int:puzzle_id>/stats", api_views.PuzzleStatsView.as_view()),
     path(
         "api/puzzles/<str:category>/latest",
         api_views.LatestPuzzleByCategoryView.as_view(),
     ),
+    path(
+        "api/puzzles/<str:category>/archive",
+        api_views.PuzzleArchiveView.as_view(),
+    ),
     path(
         "api/puzzles/<str:category>/<int:sequence_number>",
         api_views.PuzzleBySequenceNumberView.as_view(),
     ),
+    path("api/catalog", api_views.CatalogView.as_view()),
+    path("api/catalog/version", api_views.CatalogVersionView.as_view()),
     path("api/usage_events", api_views.UsageEventView.as_view()),
+    path("api/usage_events/batch", api_views.UsageEventBatchView.as_view()),
     path("api/simple", api_views.SimpleView.as_view()),
+    path("api/metrics", api_views.MetricsView.as_view()),
 ]
 
 urlpatterns += [path("silk/", include("silk.urls", namespace="silk"))]
@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sheet_musicle_server.settings")
 
 application = get_wsgi_application()
+
+# build in-memory indexes in the background, so the first requests don't pay for it
+from sheet_api.puzzle_index import answer_snapshot  # noqa: E402
+from sheet_api.work_index import work_index_snapshot  # noqa: E402
+
+work_index_snapshot.warm()
+answer_snapshot.warm()